@@ -1,27 +1,67 @@
 import tkinter as tk
-from PIL import Image, ImageTk
 import copy
+from position import (Position, WHITE, BLACK, PAWN, KING, COLOR_NAMES, PIECE_CODES, PIECE_STRINGS, CASTLING_ROOK_SQUARES,
+                      MOVE_CASTLE, MOVE_EN_PASSANT, MOVE_PIECE_SHIFT, encode_move, square, square_to_pos, scan_squares, popcount)
+
+# special_move name <-> packed move flag
+SPECIAL_MOVES = {"": 0, "promote": 0, "castle": MOVE_CASTLE, "en_passant": MOVE_EN_PASSANT}
 
 class Move():
+    # readable view over a packed position.py move integer
+    __slots__ = ('code', 'last_move')
+
     def __init__(self, position, newPos, unitType, special_move = "", promoted = "") -> None:
-        self.position = position
-        self.unit_type = unitType
-        self.new_pos = newPos
-        self.side = ""
-        if unitType.find('black')>=0:
-            self.side = 'black'
-        else:
-            self.side = 'white'
-        self.special_move = special_move
-        self.promoted = promoted
+        promotion = PIECE_CODES[promoted][1] if special_move == "promote" else 0
+        self.code = encode_move(square(*position), square(*newPos), promotion, SPECIAL_MOVES[special_move], PIECE_CODES[unitType])
         self.last_move = None
+
+    @classmethod
+    def from_code(cls, code):
+        move = cls.__new__(cls)
+        move.code = code
+        move.last_move = None
+        return move
+
+    @property
+    def position(self):
+        return square_to_pos(self.code & 63)
+
+    @property
+    def new_pos(self):
+        return square_to_pos(self.code >> 6 & 63)
+
+    @property
+    def unit_type(self):
+        return PIECE_STRINGS[divmod(self.code >> MOVE_PIECE_SHIFT, 6)]
+
+    @property
+    def side(self):
+        return COLOR_NAMES[(self.code >> MOVE_PIECE_SHIFT) // 6]
+
+    @property
+    def special_move(self):
+        if self.code >> 12 & 7:
+            return "promote"
+        if self.code & MOVE_CASTLE:
+            return "castle"
+        if self.code & MOVE_EN_PASSANT:
+            return "en_passant"
+        return ""
+
+    @property
+    def promoted(self):
+        promotion = self.code >> 12 & 7
+        return PIECE_STRINGS[((self.code >> MOVE_PIECE_SHIFT) // 6, promotion)] if promotion else ""
+
     def __str__(self) -> str:
         return self.unit_type + ': ' +str(self.position) + "->" +  str(self.new_pos) + " - " + self.special_move + " - " + self.promoted
     
 class ChessBoard(tk.Tk):
-    def __init__(self, current_board=None, current_player='white', move_log=[], playable = False, player_side = "", draw_board = True):
+    def __init__(self, current_board=None, current_player='white', move_log=[], playable = False, player_side = "", draw_board = True, position=None):
         self.current_board = current_board
-        if self.current_board is None:
+        if position is not None:
+            self.current_board = position.to_list()
+        elif self.current_board is None:
             self.current_board = [
             ['black_rook', 'black_knight', 'black_bishop', 'black_queen', 'black_king', 'black_bishop', 'black_knight', 'black_rook'],
             ['black_pawn'] * 8,
@@ -32,8 +72,8 @@ class ChessBoard(tk.Tk):
             ['white_pawn'] * 8,
             ['white_rook', 'white_knight', 'white_bishop', 'white_queen', 'white_king', 'white_bishop', 'white_knight', 'white_rook']
         ]
+        self.position = position if position is not None else Position(self.current_board, COLOR_NAMES.index(current_player))
             
-        self.previous_board = []
         self.blackCastled = False
         self.whiteCastled = False
         self.current_player = current_player
@@ -92,6 +132,7 @@ class ChessBoard(tk.Tk):
         return pieces
     
     def load_png_image(self, filename, width, height):
+        from PIL import Image, ImageTk # only the GUI needs PIL
         try:
             original_image = Image.open(filename)
             aspect_ratio = original_image.width / original_image.height
@@ -246,618 +287,15 @@ class ChessBoard(tk.Tk):
     
     def get_all_impact(self, board):
         impactPos = ([],[]) #[0] is for black, [1] is for white (not racist)
-        for i in range(8):
-            for j in range(8):
-                if board[i][j].find("black_pawn") == 0:
-                    if i + 1 < 8 and board[i+1][j] == "":
-                        impactPos[0].append((i+1,j))
-                        if i == 1 and i + 2 < 8 and board[i+2][j] == "":
-                            impactPos[0].append((i+2,j))
-                    if i + 1 < 8 and j + 1 < 8 and board[i+1][j+1].find("white") == 0:
-                            impactPos[0].append((i+1,j+1))
-                    if i + 1 < 8 and j - 1 >= 0 and board[i+1][j-1].find("white") == 0:
-                            impactPos[0].append((i+1,j-1))
-                        
-
-                elif board[i][j].find("black_rook") == 0:
-                    k = 1
-                    while j + k < 8:
-                        if board[i][j+k] == "":
-                            impactPos[0].append((i,j + k))
-                        else:
-                            if board[i][j+k].find("white")==0:
-                                impactPos[0].append((i,j + k))
-                            break
-                        k+=1
-                    k = 1
-                    while i + k < 8:
-                        if board[i+k][j] == "":
-                            impactPos[0].append((i+k,j))
-                        else:
-                            if board[i+k][j].find("white")==0:
-                                impactPos[0].append((i+k,j))
-                            break
-                        k+=1
-                    k = 1
-                    while i - k >= 0:
-                        if board[i-k][j] == "":
-                            impactPos[0].append((i-k,j))
-                        else:
-                            if board[i-k][j].find("white")==0:
-                                impactPos[0].append((i-k,j))
-                            break
-                        k+=1
-                    k = 1
-                    while j - k >= 0:
-                        if board[i][j-k] == "":
-                            impactPos[0].append((i,j-k))
-                        else:
-                            if board[i][j-k].find("white")==0:
-                                impactPos[0].append((i,j-k))
-                            break
-                        k+=1
-                elif board[i][j].find("black_knight") == 0:
-                    moves = [(-1,-2), (-1,2), (1,-2), (1,2), (-2,-1), (-2,1), (2,-1), (2,1)]
-                    moves = list(filter(lambda x: i + x[0] in list(range(0,8))  and j + x[1] in list(range(0,8)),moves))
-                    for m in moves:
-                        if board[i + m[0]][j + m[1]] == "" or board[i + m[0]][j + m[1]].find("white")==0:
-                            impactPos[0].append((i+m[0],j+m[1]))
-                elif board[i][j].find("black_bishop") == 0:
-                    k = 1
-                    while i + k < 8 and j + k <8:
-                        if board[i+k][j+k] == "":
-                            impactPos[0].append((i+k,j+k))
-                        else:
-                            if board[i+k][j+k].find("white")==0:
-                                impactPos[0].append((i+k,j+k))
-                            break
-                        k+=1
-
-                    k = 1
-                    while i - k >= 0  and j + k <8:
-                        if board[i-k][j+k] == "":
-                            impactPos[0].append((i-k,j+k))
-                        else:
-                            if board[i-k][j+k].find("white")==0:
-                                impactPos[0].append((i-k,j+k))
-                            break
-                        k+=1
-                    k = 1
-                    while i + k < 8 and j - k >=0 :
-                        if board[i+k][j-k] == "":
-                            impactPos[0].append((i+k,j-k))
-                        else:
-                            if board[i+k][j-k].find("white")==0:
-                                impactPos[0].append((i+k,j-k))
-                            break
-                        k+=1
-                    k = 1
-                    while i - k >= 0 and j - k >=0:
-                        if board[i-k][j-k] == "":
-                            impactPos[0].append((i-k,j-k))
-                        else:
-                            if board[i-k][j-k].find("white")==0:
-                                impactPos[0].append((i-k,j-k))
-                            break
-                        k+=1
-                elif board[i][j].find("black_queen") == 0:
-                    k = 1
-                    while j + k < 8:
-                        if board[i][j+k] == "":
-                            impactPos[0].append((i,j + k))
-                        else:
-                            if board[i][j+k].find("white")==0:
-                                impactPos[0].append((i,j + k))
-                            break
-                        k+=1
-                    k = 1
-                    while i + k < 8:
-                        if board[i+k][j] == "":
-                            impactPos[0].append((i+k,j))
-                        else:
-                            if board[i+k][j].find("white")==0:
-                                impactPos[0].append((i+k,j))
-                            break
-                        k+=1
-                    k = 1
-                    while i - k >= 0:
-                        if board[i-k][j] == "":
-                            impactPos[0].append((i-k,j))
-                        else:
-                            if board[i-k][j].find("white")==0:
-                                impactPos[0].append((i-k,j))
-                            break
-                        k+=1
-                    k = 1
-                    while j - k >= 0:
-                        if board[i][j-k] == "":
-                            impactPos[0].append((i,j-k))
-                        else:
-                            if board[i][j-k].find("white")==0:
-                                impactPos[0].append((i,j-k))
-                            break
-                        k+=1
-                    k = 1
-                    while i + k < 8 and j + k <8:
-                        if board[i+k][j+k] == "":
-                            impactPos[0].append((i+k,j+k))
-                        else:
-                            if board[i+k][j+k].find("white")==0:
-                                impactPos[0].append((i+k,j+k))
-                            break
-                        k+=1
-
-                    k = 1
-                    while i - k >= 0  and j + k <8:
-                        if board[i-k][j+k] == "":
-                            impactPos[0].append((i-k,j+k))
-                        else:
-                            if board[i-k][j+k].find("white")==0:
-                                impactPos[0].append((i-k,j+k))
-                            break
-                        k+=1
-                    k = 1
-                    while i + k < 8 and j - k >=0 :
-                        if board[i+k][j-k] == "":
-                            impactPos[0].append((i+k,j-k))
-                        else:
-                            if board[i+k][j-k].find("white")==0:
-                                impactPos[0].append((i+k,j-k))
-                            break
-                        k+=1
-                    k = 1
-                    while i - k >= 0 and j - k >=0:
-                        if board[i-k][j-k] == "":
-                            impactPos[0].append((i-k,j-k))
-                        else:
-                            if board[i-k][j-k].find("white")==0:
-                                impactPos[0].append((i-k,j-k))
-                            break
-                        k+=1
-                elif board[i][j].find("black_king") == 0:
-                    moves = [(1,0), (-1,0), (0,1), (0,-1), (1,1), (-1,-1), (1,-1), (-1,1)]
-                    # moves = list(filter(lambda x: (originalPos[0] + x[0] in list(range(0,8)))  and (originalPos[1] + x[1] in list(range(0,8))) ))
-                    moves = list(filter(lambda x: i + x[0] in list(range(0,8))  and j + x[1] in list(range(0,8)),moves))
-                    for m in moves:
-                        if board[i + m[0]][j + m[1]] == "" or board[i + m[0]][j + m[1]].find("white")==0:
-                            impactPos[0].append((i+m[0],j+m[1]))
-                elif board[i][j].find("white_pawn") == 0:
-                    if i - 1 >= 0 and board[i-1][j] == "":
-                        impactPos[1].append((i-1,j))
-                        if i == 6 and i - 2 >=0 and board[i-2][j] == "":
-                            impactPos[1].append((i-2,j))
-                    if i - 1 >= 0 and j + 1 < 8 and board[i-1][j+1].find("black") == 0:
-                            impactPos[1].append((i-1,j+1))
-                    if i - 1 >= 0 and j - 1 >= 0 and board[i-1][j-1].find("black") == 0:
-                            impactPos[1].append((i-1,j-1))
-                elif board[i][j].find("white_rook") == 0:
-                    k = 1
-                    while j + k < 8:
-                        if board[i][j+k] == "":
-                            impactPos[1].append((i,j + k))
-                        else:
-                            if board[i][j+k].find("black")==0:
-                                impactPos[1].append((i,j + k))
-                            break
-                        k+=1
-                    k = 1
-                    while i + k < 8:
-                        if board[i+k][j] == "":
-                            impactPos[1].append((i+k,j))
-                        else:
-                            if board[i+k][j].find("black")==0:
-                                impactPos[1].append((i+k,j))
-                            break
-                        k+=1
-                    k = 1
-                    while i - k >= 0:
-                        if board[i-k][j] == "":
-                            impactPos[1].append((i-k,j))
-                        else:
-                            if board[i-k][j].find("black")==0:
-                                impactPos[1].append((i-k,j))
-                            break
-                        k+=1
-                    k = 1
-                    while j - k >= 0:
-                        if board[i][j-k] == "":
-                            impactPos[1].append((i,j-k))
-                        else:
-                            if board[i][j-k].find("black")==0:
-                                impactPos[1].append((i,j-k))
-                            break
-                        k+=1
-                elif board[i][j].find("white_knight") == 0:
-                    moves = [(-1,-2), (-1,2), (1,-2), (1,2), (-2,-1), (-2,1), (2,-1), (2,1)]
-                    moves = list(filter(lambda x: i + x[0] in list(range(0,8))  and j + x[1] in list(range(0,8)),moves))
-                    for m in moves:
-                        if board[i + m[0]][j + m[1]] == "" or board[i + m[0]][j + m[1]].find("black")==0:
-                            impactPos[1].append((i+m[0],j+m[1]))
-                elif board[i][j].find("white_bishop") == 0:
-                    k = 1
-                    while i + k < 8 and j + k <8:
-                        if board[i+k][j+k] == "":
-                            impactPos[1].append((i+k,j+k))
-                        else:
-                            if board[i+k][j+k].find("black")==0:
-                                impactPos[1].append((i+k,j+k))
-                            break
-                        k+=1
-
-                    k = 1
-                    while i - k >= 0  and j + k <8:
-                        if board[i-k][j+k] == "":
-                            impactPos[1].append((i-k,j+k))
-                        else:
-                            if board[i-k][j+k].find("black")==0:
-                                impactPos[1].append((i-k,j+k))
-                            break
-                        k+=1
-                    k = 1
-                    while i + k < 8 and j - k >=0 :
-                        if board[i+k][j-k] == "":
-                            impactPos[1].append((i+k,j-k))
-                        else:
-                            if board[i+k][j-k].find("black")==0:
-                                impactPos[1].append((i+k,j-k))
-                            break
-                        k+=1
-                    k = 1
-                    while i - k >= 0 and j - k >=0:
-                        if board[i-k][j-k] == "":
-                            impactPos[1].append((i-k,j-k))
-                        else:
-                            if board[i-k][j-k].find("black")==0:
-                                impactPos[1].append((i-k,j-k))
-                            break
-                        k+=1
-                elif board[i][j].find("white_queen") == 0:
-                    k = 1
-                    while j + k < 8:
-                        if board[i][j+k] == "":
-                            impactPos[1].append((i,j + k))
-                        else:
-                            if board[i][j+k].find("black")==0:
-                                impactPos[1].append((i,j + k))
-                            break
-                        k+=1
-                    k = 1
-                    while i + k < 8:
-                        if board[i+k][j] == "":
-                            impactPos[1].append((i+k,j))
-                        else:
-                            if board[i+k][j].find("black")==0:
-                                impactPos[1].append((i+k,j))
-                            break
-                        k+=1
-                    k = 1
-                    while i - k >= 0:
-                        if board[i-k][j] == "":
-                            impactPos[1].append((i-k,j))
-                        else:
-                            if board[i-k][j].find("black")==0:
-                                impactPos[1].append((i-k,j))
-                            break
-                        k+=1
-                    k = 1
-                    while j - k >= 0:
-                        if board[i][j-k] == "":
-                            impactPos[1].append((i,j-k))
-                        else:
-                            if board[i][j-k].find("black")==0:
-                                impactPos[1].append((i,j-k))
-                            break
-                        k+=1
-                    k = 1
-                    while i + k < 8 and j + k <8:
-                        if board[i+k][j+k] == "":
-                            impactPos[1].append((i+k,j+k))
-                        else:
-                            if board[i+k][j+k].find("black")==0:
-                                impactPos[1].append((i+k,j+k))
-                            break
-                        k+=1
-
-                    k = 1
-                    while i - k >= 0  and j + k <8:
-                        if board[i-k][j+k] == "":
-                            impactPos[1].append((i-k,j+k))
-                        else:
-                            if board[i-k][j+k].find("black")==0:
-                                impactPos[1].append((i-k,j+k))
-                            break
-                        k+=1
-                    k = 1
-                    while i + k < 8 and j - k >=0 :
-                        if board[i+k][j-k] == "":
-                            impactPos[1].append((i+k,j-k))
-                        else:
-                            if board[i+k][j-k].find("black")==0:
-                                impactPos[1].append((i+k,j-k))
-                            break
-                        k+=1
-                    k = 1
-                    while i - k >= 0 and j - k >=0:
-                        if board[i-k][j-k] == "":
-                            impactPos[1].append((i-k,j-k))
-                        else:
-                            if board[i-k][j-k].find("black")==0:
-                                impactPos[1].append((i-k,j-k))
-                            break
-                        k+=1
-                elif board[i][j].find("white_king") == 0:
-                    moves = [(1,0), (-1,0), (0,1), (0,-1), (1,1), (-1,-1), (1,-1), (-1,1)]
-                    # moves = list(filter(lambda x: (originalPos[0] + x[0] in list(range(0,8)))  and (originalPos[1] + x[1] in list(range(0,8))) ))
-                    moves = list(filter(lambda x: i + x[0] in list(range(0,8))  and j + x[1] in list(range(0,8)),moves))
-                    for m in moves:
-                        if board[i + m[0]][j + m[1]] == "" or board[i + m[0]][j + m[1]].find("black")==0:
-                            impactPos[1].append((i+m[0],j+m[1]))
+        pos = Position(board)
+        for color, side in ((BLACK, 0), (WHITE, 1)):
+            for sq in scan_squares(pos.occupied_co[color]):
+                for target in scan_squares(pos.targets(sq, color, pos.mailbox[sq][1])):
+                    impactPos[side].append(square_to_pos(target))
         return impactPos
 
     def get_all_possible_moves(self,player: str = ['white', 'black']):
-        impactPos = self.get_all_impact(copy.deepcopy(self.current_board)) #[0] is for black, [1] is for white (not racist)
-        movesList = []
-        kingPos = (-1,-1)
-        for i in range(8):
-            for j in range(8):
-                if self.current_board[i][j].find("pawn") >= 0 and self.current_board[i][j].find(player) >= 0:
-                    direction = (1,0)
-                    doubleDirection = (2,0)
-                    attackDirections = [(1,1), (1,-1)]
-                    promoteList = ['rook', 'knight', 'bishop', 'queen']
-                    mList = []
-                    if player == 'black':
-                        if (i+direction[0],j+direction[1]) in impactPos[0] and self.current_board[i+direction[0]][j+direction[1]]=="":
-                            mList.append(Move((i,j),(i+direction[0],j+direction[1]),self.current_board[i][j]))
-                            if (i+direction[0]*2,j+direction[1]) in impactPos[0] and self.current_board[i+direction[0]*2][j+direction[1]]=="" and i==1:
-                                mList.append(Move((i,j),(i+direction[0]*2,j+direction[1]),self.current_board[i][j]))
-                        for dir in attackDirections:
-                            if (i+dir[0],j+dir[1]) in impactPos[0] and self.current_board[i+dir[0]][j+dir[1]].find("white")>=0:
-                                mList.append(Move((i,j),(i+dir[0],j+dir[1]),self.current_board[i][j]))
-                        for m in mList:
-                            if m.new_pos[0] == 7:
-                                
-                                for pr in promoteList:
-                                    movesList.append(Move(m.position,m.new_pos,m.unit_type,special_move="promote",promoted = m.unit_type.replace("pawn",pr)))
-                            else:
-                                movesList.append(m)
-        
-
-                        
-                    elif player == 'white':
-                        if (i-direction[0],j-direction[1]) in impactPos[1] and self.current_board[i-direction[0]][j-direction[1]]=="":
-                            mList.append(Move((i,j),(i-direction[0],j-direction[1]),self.current_board[i][j]))
-                            if (i-direction[0]*2,j-direction[1]) in impactPos[1] and self.current_board[i-direction[0]*2][j-direction[1]]=="" and i==6:
-                                mList.append(Move((i,j),(i-direction[0]*2,j-direction[1]),self.current_board[i][j]))
-                        for dir in attackDirections:
-                            if (i-dir[0],j-dir[1]) in impactPos[1] and self.current_board[i-dir[0]][j-dir[1]].find("black")>=0:
-                                mList.append(Move((i,j),(i-dir[0],j-dir[1]),self.current_board[i][j]))
-                        for m in mList:
-                            if m.new_pos[0] == 0:
-                                
-                                for pr in promoteList:
-                                    movesList.append(Move(m.position,m.new_pos,m.unit_type,special_move="promote",promoted = m.unit_type.replace("pawn",pr)))
-                            else:
-                                movesList.append(m)
-                elif self.current_board[i][j].find("rook") >= 0 and self.current_board[i][j].find(player) >= 0:
-                    side = 0
-                    if player == "white":
-                        side = 1
-                    k = 1
-                    while j + k < 8:
-                        if (i,j+k) in impactPos[side]:
-                            movesList.append(Move((i,j),(i,j+k),self.current_board[i][j]))
-                            if self.current_board[i][j+k] != "":
-                                break
-                        else:
-                            break
-                        k+=1
-                    k = 1
-                    while j - k >= 0:
-                        if (i,j-k) in impactPos[side]:
-                            movesList.append(Move((i,j),(i,j-k),self.current_board[i][j]))
-                            if self.current_board[i][j-k] != "":
-                                break 
-                        else:
-                            break
-                        k+=1
-                    k = 1
-                    while i + k < 8:
-                        if (i+k,j) in impactPos[side]:
-                            movesList.append(Move((i,j),(i+k,j),self.current_board[i][j]))
-                            if self.current_board[i+k][j] != "":
-                                break
-                        else:
-                            break
-                        k+=1
-                    k = 1
-                    while i - k >= 0:
-                        if (i - k,j) in impactPos[side]:
-                            movesList.append(Move((i,j),(i-k,j),self.current_board[i][j]))
-                            if self.current_board[i-k][j] != "":
-                                break
-                        else:
-                            break
-                        k+=1
-                    
-                    #castling (not completed)
-                    if not self.current_board[i][j].endswith("_"):
-                        #finding king
-                        kingInd = -1
-                        for k in range(8):
-                            if self.current_board[i][k].find(player+"_king")>=0:
-                                kingInd = k
-                        if k>=0 and not self.current_board[i][kingInd].endswith("_"):
-                            if not (i,kingInd) in impactPos[abs(side-1)]:
-                                pass
-
-                         
-                elif self.current_board[i][j].find("knight") >= 0 and self.current_board[i][j].find(player) >= 0:
-                    side = 0
-                    if player == "white":
-                        side = 1
-                    moves = [(-1,-2), (-1,2), (1,-2), (1,2), (-2,-1), (-2,1), (2,-1), (2,1)]
-                    for m in moves:
-                        if (i + m[0], j + m[1]) in impactPos[side]:
-                            movesList.append(Move((i,j),(i+m[0],j+m[1]),self.current_board[i][j]))
-
-
-
-                elif self.current_board[i][j].find("bishop") >= 0 and self.current_board[i][j].find(player) >= 0:
-                    side = 0
-                    if player == "white":
-                        side = 1
-                    k = 1
-                    while i + k < 8 and j + k <8:
-                        if (i+k,j+k) in impactPos[side]:
-                            movesList.append(Move((i,j),(i+k,j+k),self.current_board[i][j]))
-                            if self.current_board[i+k][j+k] != "":
-                                break
-                        else:
-                            break
-                        k+=1
-                    k = 1
-                    while i - k >= 0 and j + k <8:
-                        if (i-k,j+k) in impactPos[side]:
-                            movesList.append(Move((i,j),(i-k,j+k),self.current_board[i][j]))
-                            if self.current_board[i-k][j+k] != "":
-                                break
-                        else:
-                            break
-                        k+=1
-                    k = 1
-                    while i + k < 8 and j - k >= 0:
-                        if (i+k,j-k) in impactPos[side]:
-                            movesList.append(Move((i,j),(i+k,j-k),self.current_board[i][j]))
-                            if self.current_board[i+k][j-k] != "":
-                                break
-                        else:
-                            break
-                        k+=1
-                    k = 1
-                    while i - k >=0 and j - k >= 0:
-                        if (i-k,j-k) in impactPos[side]:
-                            movesList.append(Move((i,j),(i-k,j-k),self.current_board[i][j]))
-                            if self.current_board[i-k][j-k] != "":
-                                break
-                        else:
-                            break
-                        k+=1
-                    
-                elif self.current_board[i][j].find("queen") >= 0 and self.current_board[i][j].find(player) >= 0:
-                    side = 0
-                    if player == "white":
-                        side = 1
-                    k = 1
-                    while j + k < 8:
-                        if (i,j+k) in impactPos[side]:
-                            movesList.append(Move((i,j),(i,j+k),self.current_board[i][j]))
-                            if self.current_board[i][j+k] != "":
-                                break
-                        else:
-                            break
-                        k+=1
-                    k = 1
-                    while j - k >= 0:
-                        if (i,j-k) in impactPos[side]:
-                            movesList.append(Move((i,j),(i,j-k),self.current_board[i][j]))
-                            if self.current_board[i][j-k] != "":
-                                break 
-                        else:
-                            break
-                        k+=1
-                    k = 1
-                    while i + k < 8:
-                        if (i+k,j) in impactPos[side]:
-                            movesList.append(Move((i,j),(i+k,j),self.current_board[i][j]))
-                            if self.current_board[i+k][j] != "":
-                                break
-                        else:
-                            break
-                        k+=1
-                    k = 1
-                    while i - k >= 0:
-                        if (i - k,j) in impactPos[side]:
-                            movesList.append(Move((i,j),(i-k,j),self.current_board[i][j]))
-                            if self.current_board[i-k][j] != "":
-                                break
-                        else:
-                            break
-                        k+=1
-                    k = 1
-                    while i + k < 8 and j + k <8:
-                        if (i+k,j+k) in impactPos[side]:
-                            movesList.append(Move((i,j),(i+k,j+k),self.current_board[i][j]))
-                            if self.current_board[i+k][j+k] != "":
-                                break
-                        else:
-                            break
-                        k+=1
-                    k = 1
-                    while i - k >= 0 and j + k <8:
-                        if (i-k,j+k) in impactPos[side]:
-                            movesList.append(Move((i,j),(i-k,j+k),self.current_board[i][j]))
-                            if self.current_board[i-k][j+k] != "":
-                                break
-                        else:
-                            break
-                        k+=1
-                    k = 1
-                    while i + k < 8 and j - k >= 0:
-                        if (i+k,j-k) in impactPos[side]:
-                            movesList.append(Move((i,j),(i+k,j-k),self.current_board[i][j]))
-                            if self.current_board[i+k][j-k] != "":
-                                break
-                        else:
-                            break
-                        k+=1
-                    k = 1
-                    while i - k >=0 and j - k >= 0:
-                        if (i-k,j-k) in impactPos[side]:
-                            movesList.append(Move((i,j),(i-k,j-k),self.current_board[i][j]))
-                            if self.current_board[i-k][j-k] != "":
-                                break
-                        else:
-                            break
-                        k+=1
-                elif self.current_board[i][j].find("king") >= 0 and self.current_board[i][j].find(player) >= 0:
-                    kingPos = (i,j)
-                    side = 0
-                    if player == "white":
-                        side = 1
-                    moves = [(1,0), (-1,0), (0,1), (0,-1), (1,1), (-1,-1), (1,-1), (-1,1)]
-                    for m in moves:
-                        if (i + m[0], j + m[1]) in impactPos[side]:
-                            movesList.append(Move((i,j),(i+m[0],j+m[1]),self.current_board[i][j]))
-        side = 0
-        if player == "white":
-            side = 1
-
-        if True:
-            legalList = []
-
-            for mv in movesList:
-                temp_board = copy.deepcopy(self.current_board)
-                unit = temp_board[mv.position[0]][mv.position[1]]
-                temp_board[mv.position[0]][mv.position[1]] = ""
-                temp_board[mv.new_pos[0]][mv.new_pos[1]] = unit
-
-                if mv.special_move == "promote":
-                    temp_board[mv.new_pos[0]][mv.new_pos[1]] = mv.promoted
-                newImpact = self.get_all_impact(copy.deepcopy(temp_board))
-                
-                if mv.unit_type.find("_king")>0:
-                    if mv.new_pos in newImpact[(side + 1)%2]:
-                        continue
-                else:
-
-                    if kingPos in newImpact[(side + 1)%2]:
-                        continue
-                legalList.append(mv)
-
-            return legalList
-        else:
-            return movesList
+        return [Move.from_code(code) for code in self.position.legal_moves(COLOR_NAMES.index(player))]
     
     def boardDisplay(self):
         square_size = 64
@@ -879,376 +317,62 @@ class ChessBoard(tk.Tk):
             self.canvas.create_rectangle(x1, y1, x2, y2, fill="yellow")
             self.draw_pieces()
     
+    @classmethod
+    def from_fen(cls, fen, **kwargs):
+        position = Position()
+        position.set_fen(fen)
+        return cls.from_position(position, **kwargs)
+
+    @classmethod
+    def from_chess_board(cls, board, **kwargs):
+        position = Position()
+        position.load_chess_board(board)
+        return cls.from_position(position, **kwargs)
+
+    @classmethod
+    def from_position(cls, position, **kwargs):
+        kwargs.setdefault("draw_board", False)
+        return cls(current_player=COLOR_NAMES[position.turn], position=position, **kwargs)
+
+    def fen(self):
+        return self.position.fen()
+
+    def to_chess_board(self):
+        return self.position.to_chess_board()
+
+    @property
+    def zobrist_key(self):
+        return self.position.zobrist_key
+
     def make_move(self,move: Move):
         self.last_move = move
-        self.previous_board.insert(0,copy.deepcopy(self.current_board))
-        unit = self.current_board[move.position[0]][move.position[1]]
-        self.current_board[move.position[0]][move.position[1]] = ""
-        self.current_board[move.new_pos[0]][move.new_pos[1]] = unit
-        if move.special_move == "promote":
-            self.current_board[move.new_pos[0]][move.new_pos[1]] = move.promoted
+        self.position.push(move.code)
+        self.sync_board(self.position.undo_stack[-1])
         
     def undo_move(self):
-        if len(self.previous_board)==0:
+        if len(self.position.undo_stack)==0:
             return
-        self.current_board = copy.deepcopy(self.previous_board[0])
-        self.previous_board.pop(0)
+        self.sync_board(self.position.pop())
+
+    def sync_board(self, record):
+        # copy the squares touched by an undo record back into the 8x8 string board
+        from_sq, to_sq, piece_type, _, capture_sq = record[:5]
+        squares = [from_sq, to_sq, capture_sq]
+        if piece_type == KING and abs(to_sq - from_sq) == 2:
+            squares.extend(CASTLING_ROOK_SQUARES[to_sq])
+        for sq in squares:
+            piece = self.position.mailbox[sq]
+            self.current_board[7 - (sq >> 3)][sq & 7] = PIECE_STRINGS[piece] if piece else ""
     
     def impact_pos(self,unitType,pos):
-        impactPos = [] 
-        i,j = pos
-        tempboard = copy.deepcopy(self.current_board)
-        if unitType == "black_pawn":
-            if i + 1 < 8 and tempboard[i+1][j] == "":
-                impactPos.append((i+1,j))
-                if i == 1 and i + 2 < 8 and tempboard[i+2][j] == "":
-                    impactPos.append((i+2,j))
-            if i + 1 < 8 and j + 1 < 8 and tempboard[i+1][j+1].find("white") == 0:
-                    impactPos.append((i+1,j+1))
-            if i + 1 < 8 and j - 1 >= 0 and tempboard[i+1][j-1].find("white") == 0:
-                    impactPos.append((i+1,j-1))
-        elif unitType == "black_rook":
-            k = 1
-            while j + k < 8:
-                if tempboard[i][j+k] == "":
-                    impactPos.append((i,j + k))
-                else:
-                    if tempboard[i][j+k].find("white")==0:
-                        impactPos.append((i,j + k))
-                    break
-                k+=1
-            k = 1
-            while i + k < 8:
-                if tempboard[i+k][j] == "":
-                    impactPos.append((i+k,j))
-                else:
-                    if tempboard[i+k][j].find("white")==0:
-                        impactPos.append((i+k,j))
-                    break
-                k+=1
-            k = 1
-            while i - k >= 0:
-                if tempboard[i-k][j] == "":
-                    impactPos.append((i-k,j))
-                else:
-                    if tempboard[i-k][j].find("white")==0:
-                        impactPos.append((i-k,j))
-                    break
-                k+=1
-            k = 1
-            while j - k >= 0:
-                if tempboard[i][j-k] == "":
-                    impactPos.append((i,j-k))
-                else:
-                    if tempboard[i][j-k].find("white")==0:
-                        impactPos.append((i,j-k))
-                    break
-                k+=1
-        
-        elif unitType == "black_knight":
-            moves = [(-1,-2), (-1,2), (1,-2), (1,2), (-2,-1), (-2,1), (2,-1), (2,1)]
-            moves = list(filter(lambda x: i + x[0] in list(range(0,8))  and j + x[1] in list(range(0,8)),moves))
-            for m in moves:
-                if tempboard[i + m[0]][j + m[1]] == "" or tempboard[i + m[0]][j + m[1]].find("white")==0:
-                    impactPos.append((i+m[0],j+m[1]))
-
-        elif unitType == "black_bishop":
-            k = 1
-            while i + k < 8 and j + k <8:
-                if tempboard[i+k][j+k] == "":
-                    impactPos.append((i+k,j+k))
-                else:
-                    if tempboard[i+k][j+k].find("white")==0:
-                        impactPos.append((i+k,j+k))
-                    break
-                k+=1
-
-            k = 1
-            while i - k >= 0  and j + k <8:
-                if tempboard[i-k][j+k] == "":
-                    impactPos.append((i-k,j+k))
-                else:
-                    if tempboard[i-k][j+k].find("white")==0:
-                        impactPos.append((i-k,j+k))
-                    break
-                k+=1
-            k = 1
-            while i + k < 8 and j - k >=0 :
-                if tempboard[i+k][j-k] == "":
-                    impactPos.append((i+k,j-k))
-                else:
-                    if tempboard[i+k][j-k].find("white")==0:
-                        impactPos.append((i+k,j-k))
-                    break
-                k+=1
-            k = 1
-            while i - k >= 0 and j - k >=0:
-                if tempboard[i-k][j-k] == "":
-                    impactPos.append((i-k,j-k))
-                else:
-                    if tempboard[i-k][j-k].find("white")==0:
-                        impactPos.append((i-k,j-k))
-                    break
-                k+=1    
-        elif unitType == "black_queen":
-            k = 1
-            while j + k < 8:
-                if tempboard[i][j+k] == "":
-                    impactPos.append((i,j + k))
-                else:
-                    if tempboard[i][j+k].find("white")==0:
-                        impactPos.append((i,j + k))
-                    break
-                k+=1
-            k = 1
-            while i + k < 8:
-                if tempboard[i+k][j] == "":
-                    impactPos.append((i+k,j))
-                else:
-                    if tempboard[i+k][j].find("white")==0:
-                        impactPos.append((i+k,j))
-                    break
-                k+=1
-            k = 1
-            while i - k >= 0:
-                if tempboard[i-k][j] == "":
-                    impactPos.append((i-k,j))
-                else:
-                    if tempboard[i-k][j].find("white")==0:
-                        impactPos.append((i-k,j))
-                    break
-                k+=1
-            k = 1
-            while j - k >= 0:
-                if tempboard[i][j-k] == "":
-                    impactPos.append((i,j-k))
-                else:
-                    if tempboard[i][j-k].find("white")==0:
-                        impactPos.append((i,j-k))
-                    break
-                k+=1
-            k = 1
-            while i + k < 8 and j + k <8:
-                if tempboard[i+k][j+k] == "":
-                    impactPos.append((i+k,j+k))
-                else:
-                    if tempboard[i+k][j+k].find("white")==0:
-                        impactPos.append((i+k,j+k))
-                    break
-                k+=1
-
-            k = 1
-            while i - k >= 0  and j + k <8:
-                if tempboard[i-k][j+k] == "":
-                    impactPos.append((i-k,j+k))
-                else:
-                    if tempboard[i-k][j+k].find("white")==0:
-                        impactPos.append((i-k,j+k))
-                    break
-                k+=1
-            k = 1
-            while i + k < 8 and j - k >=0 :
-                if tempboard[i+k][j-k] == "":
-                    impactPos.append((i+k,j-k))
-                else:
-                    if tempboard[i+k][j-k].find("white")==0:
-                        impactPos.append((i+k,j-k))
-                    break
-                k+=1
-            k = 1
-            while i - k >= 0 and j - k >=0:
-                if tempboard[i-k][j-k] == "":
-                    impactPos.append((i-k,j-k))
-                else:
-                    if tempboard[i-k][j-k].find("white")==0:
-                        impactPos.append((i-k,j-k))
-                    break
-                k+=1
-        elif unitType == "black_king":
-            moves = [(1,0), (-1,0), (0,1), (0,-1), (1,1), (-1,-1), (1,-1), (-1,1)]
-            # moves = list(filter(lambda x: (originalPos[0] + x[0] in list(range(0,8)))  and (originalPos[1] + x[1] in list(range(0,8))) ))
-            moves = list(filter(lambda x: i + x[0] in list(range(0,8))  and j + x[1] in list(range(0,8)),moves))
-            for m in moves:
-                if tempboard[i + m[0]][j + m[1]] == "" or tempboard[i + m[0]][j + m[1]].find("white")==0:
-                    impactPos.append((i+m[0],j+m[1]))
-                    
-        elif unitType =="white_pawn":
-            if i - 1 >= 0 and tempboard[i-1][j] == "":
-                impactPos.append((i-1,j))
-                if i == 6 and i - 2 >=0 and tempboard[i-2][j] == "":
-                    impactPos.append((i-2,j))
-            if i - 1 >= 0 and j + 1 < 8 and tempboard[i-1][j+1].find("black") == 0:
-                    impactPos.append((i-1,j+1))
-            if i - 1 >= 0 and j - 1 >= 0 and tempboard[i-1][j-1].find("black") == 0:
-                    impactPos.append((i-1,j-1))   
-        elif unitType == "white_rook":
-            k = 1
-            while j + k < 8:
-                if tempboard[i][j+k] == "":
-                    impactPos.append((i,j + k))
-                else:
-                    if tempboard[i][j+k].find("black")==0:
-                        impactPos.append((i,j + k))
-                    break
-                k+=1
-            k = 1
-            while i + k < 8:
-                if tempboard[i+k][j] == "":
-                    impactPos.append((i+k,j))
-                else:
-                    if tempboard[i+k][j].find("black")==0:
-                        impactPos.append((i+k,j))
-                    break
-                k+=1
-            k = 1
-            while i - k >= 0:
-                if tempboard[i-k][j] == "":
-                    impactPos.append((i-k,j))
-                else:
-                    if tempboard[i-k][j].find("black")==0:
-                        impactPos.append((i-k,j))
-                    break
-                k+=1
-            k = 1
-            while j - k >= 0:
-                if tempboard[i][j-k] == "":
-                    impactPos.append((i,j-k))
-                else:
-                    if tempboard[i][j-k].find("black")==0:
-                        impactPos.append((i,j-k))
-                    break
-                k+=1   
-        elif unitType =="white_knight":
-            moves = [(-1,-2), (-1,2), (1,-2), (1,2), (-2,-1), (-2,1), (2,-1), (2,1)]
-            moves = list(filter(lambda x: i + x[0] in list(range(0,8))  and j + x[1] in list(range(0,8)),moves))
-            for m in moves:
-                if tempboard[i + m[0]][j + m[1]] == "" or tempboard[i + m[0]][j + m[1]].find("black")==0:
-                    impactPos.append((i+m[0],j+m[1]))    
-
-        elif unitType == "white_bishop":
-            k = 1
-            while i + k < 8 and j + k <8:
-                if tempboard[i+k][j+k] == "":
-                    impactPos.append((i+k,j+k))
-                else:
-                    if tempboard[i+k][j+k].find("black")==0:
-                        impactPos.append((i+k,j+k))
-                    break
-                k+=1
-
-            k = 1
-            while i - k >= 0  and j + k <8:
-                if tempboard[i-k][j+k] == "":
-                    impactPos.append((i-k,j+k))
-                else:
-                    if tempboard[i-k][j+k].find("black")==0:
-                        impactPos.append((i-k,j+k))
-                    break
-                k+=1
-            k = 1
-            while i + k < 8 and j - k >=0 :
-                if tempboard[i+k][j-k] == "":
-                    impactPos.append((i+k,j-k))
-                else:
-                    if tempboard[i+k][j-k].find("black")==0:
-                        impactPos.append((i+k,j-k))
-                    break
-                k+=1
-            k = 1
-            while i - k >= 0 and j - k >=0:
-                if tempboard[i-k][j-k] == "":
-                    impactPos.append((i-k,j-k))
-                else:
-                    if tempboard[i-k][j-k].find("black")==0:
-                        impactPos.append((i-k,j-k))
-                    break
-                k+=1
-
-            
-        elif unitType == "white_queen":
-            k = 1
-            while j + k < 8:
-                if tempboard[i][j+k] == "":
-                    impactPos.append((i,j + k))
-                else:
-                    if tempboard[i][j+k].find("black")==0:
-                        impactPos.append((i,j + k))
-                    break
-                k+=1
-            k = 1
-            while i + k < 8:
-                if tempboard[i+k][j] == "":
-                    impactPos.append((i+k,j))
-                else:
-                    if tempboard[i+k][j].find("black")==0:
-                        impactPos.append((i+k,j))
-                    break
-                k+=1
-            k = 1
-            while i - k >= 0:
-                if tempboard[i-k][j] == "":
-                    impactPos.append((i-k,j))
-                else:
-                    if tempboard[i-k][j].find("black")==0:
-                        impactPos.append((i-k,j))
-                    break
-                k+=1
-            k = 1
-            while j - k >= 0:
-                if tempboard[i][j-k] == "":
-                    impactPos.append((i,j-k))
-                else:
-                    if tempboard[i][j-k].find("black")==0:
-                        impactPos.append((i,j-k))
-                    break
-                k+=1
-            k = 1
-            while i + k < 8 and j + k <8:
-                if tempboard[i+k][j+k] == "":
-                    impactPos.append((i+k,j+k))
-                else:
-                    if tempboard[i+k][j+k].find("black")==0:
-                        impactPos.append((i+k,j+k))
-                    break
-                k+=1
-
-            k = 1
-            while i - k >= 0  and j + k <8:
-                if tempboard[i-k][j+k] == "":
-                    impactPos.append((i-k,j+k))
-                else:
-                    if tempboard[i-k][j+k].find("black")==0:
-                        impactPos.append((i-k,j+k))
-                    break
-                k+=1
-            k = 1
-            while i + k < 8 and j - k >=0 :
-                if tempboard[i+k][j-k] == "":
-                    impactPos.append((i+k,j-k))
-                else:
-                    if tempboard[i+k][j-k].find("black")==0:
-                        impactPos.append((i+k,j-k))
-                    break
-                k+=1
-            k = 1
-            while i - k >= 0 and j - k >=0:
-                if tempboard[i-k][j-k] == "":
-                    impactPos.append((i-k,j-k))
-                else:
-                    if tempboard[i-k][j-k].find("black")==0:
-                        impactPos.append((i-k,j-k))
-                    break
-                k+=1   
-
-        elif unitType =="white_king":
-            moves = [(1,0), (-1,0), (0,1), (0,-1), (1,1), (-1,-1), (1,-1), (-1,1)]
-            # moves = list(filter(lambda x: (originalPos[0] + x[0] in list(range(0,8)))  and (originalPos[1] + x[1] in list(range(0,8))) ))
-            moves = list(filter(lambda x: i + x[0] in list(range(0,8))  and j + x[1] in list(range(0,8)),moves))
-            for m in moves:
-                if tempboard[i + m[0]][j + m[1]] == "" or tempboard[i + m[0]][j + m[1]].find("black")==0:
-                    impactPos.append((i+m[0],j+m[1]))    
-                    
-        return impactPos
+        color, piece_type = PIECE_CODES[unitType]
+        sq = square(*pos)
+        targets = self.position.targets(sq, color, piece_type)
+        if piece_type == KING and self.position.mailbox[sq] == (color, KING):
+            targets |= self.position.castling_targets(color)
+        elif piece_type == PAWN and self.position.ep_captures(color) >> sq & 1:
+            targets |= 1 << self.position.ep_square
+        return [square_to_pos(target) for target in scan_squares(targets)]
         
     def read_move(self,move:Move):
       # position, newPos, unitType, special_move = "", promoted = "" 
@@ -1269,8 +393,6 @@ class ChessBoard(tk.Tk):
             print("error")
             return
         else:
-            self.previous_board.insert(0,copy.deepcopy(self.current_board))
-
             a,b = oldPosX,oldPosY
             x,y = newPosX,newPosY
             r = int((b)//self.size)
@@ -1303,290 +425,21 @@ class ChessBoard(tk.Tk):
             self.move_log.append(Move((r,c),(row,col),tags[0]))
             for ele in self.move_log:
                 print(ele)
-            self.previous_board.insert(0,copy.deepcopy(self.current_board))
-            self.current_board[self.move_log[-1].position[0]][self.move_log[-1].position[1]] = ""
-            self.current_board[self.move_log[-1].new_pos[0]][self.move_log[-1].new_pos[1]] = move.unit_type
-            if self.move_log[-1].special_move == "promote":
-                self.current_board[self.move_log[-1].new_pos[0]][self.move_log[-1].new_pos[1]] = self.move_log[-1].promoted
+            self.make_move(move)
     
     def isCheck(self, board=None, player:str =['white','black'], ):
         
         # player nguoi 
-
-        tempboard = copy.deepcopy(board) if board else copy.deepcopy(self.current_board)
-        originalPos = None
-        for i in range(8):
-            for j in range(8):
-                if tempboard[i][j].find("king") >= 0 and tempboard[i][j].find(player) >= 0:
-                    originalPos=[i,j]
-        if player == "black":
-            i = 1
-            #check diag
-            flag =False
-            while originalPos[0] - i > 0 and originalPos[1] - i > 0 and not flag:
-                if  tempboard[originalPos[0]-i][originalPos[1]-i] == "white_king" and i==1:
-                    flag= True
-                    break
-                
-                if tempboard[originalPos[0]-i][originalPos[1]-i]  not in ["white_queen","white_bishop",""]:
-                    flag =False
-                    break
-                if tempboard[originalPos[0]-i][originalPos[1]-i] == "white_queen" or tempboard[originalPos[0]-i][originalPos[1]-i] == "white_bishop":
-                    flag= True
-                    break
-                i+=1
-            i = 1
-            
-            while originalPos[0] - i > 0 and originalPos[1] + i < 8 and not flag:
-                if tempboard[originalPos[0]-i][originalPos[1]+i] == "white_king" and i==1:
-                    flag= True
-                    break
-                
-                if tempboard[originalPos[0]-i][originalPos[1]+i]  not in ["white_queen","white_bishop",""]:
-                    flag =False
-                    break
-
-                if tempboard[originalPos[0]-i][originalPos[1]+i] == "white_queen" or tempboard[originalPos[0]-i][originalPos[1]+i] == "white_bishop":
-                    flag= True
-                    break
-                i+=1
-            i = 1
-
-            while originalPos[0] + i < 8 and originalPos[1] - i > 0 and not flag:
-                if (tempboard[originalPos[0]+i][originalPos[1]-i] == "white_pawn" or tempboard[originalPos[0]+i][originalPos[1]-i] == "white_king") and i==1:
-                    flag= True
-                    break
-                if tempboard[originalPos[0]+i][originalPos[1]-i]  not in ["white_queen","white_bishop",""]:
-                    flag =False
-                    break
-                if tempboard[originalPos[0]+i][originalPos[1]-i] == "white_queen" or tempboard[originalPos[0]+i][originalPos[1]-i] == "white_bishop":
-                    flag= True
-                    break
-                i+=1
-            i = 1
-
-            while originalPos[0] + i < 8 and originalPos[1] + i <8 and not flag:
-                if (tempboard[originalPos[0]+i][originalPos[1]+i] == "white_pawn" or tempboard[originalPos[0]+i][originalPos[1]+i] == "white_king") and i==1:
-                    flag= True
-                    break
-                if tempboard[originalPos[0]+i][originalPos[1]+i]  not in ["white_queen","white_bishop",""]:
-                    flag =False
-                    break
-                if tempboard[originalPos[0]+i][originalPos[1]+i] == "white_queen" or tempboard[originalPos[0]+i][originalPos[1]+i] == "white_bishop":
-                    flag= True
-                    break
-                i+=1
-            i = 1
-            # check cross:
-            while originalPos[1] + i <8 and not flag:
-                if tempboard[originalPos[0]][originalPos[1]+i] == "white_king"  and i==1:
-                    flag= True
-                    break
-                if tempboard[originalPos[0]][originalPos[1]+i]  not in ["white_queen","white_rook",""]:
-                    flag =False
-                    break
-                if tempboard[originalPos[0]][originalPos[1]+i] == "white_queen" or tempboard[originalPos[0]][originalPos[1]+i] == "white_rook":
-                    flag= True
-                    break
-                i+=1
-            i = 1
-            while originalPos[0] + i <8 and not flag:
-                if tempboard[originalPos[0]+i][originalPos[1]] == "white_king"  and i==1:
-                    flag= True
-                    break
-                if tempboard[originalPos[0]+i][originalPos[1]]  not in ["white_queen","white_rook",""]:
-                    flag =False
-                    break
-                if tempboard[originalPos[0]+i][originalPos[1]] == "white_queen" or tempboard[originalPos[0]+i][originalPos[1]] == "white_rook":
-                    flag= True
-                    break
-                i+=1
-            i = 1
-            while originalPos[1] - i >8 and not flag:
-                if tempboard[originalPos[0]][originalPos[1]-i] == "white_king"  and i==1:
-                    flag= True
-                    break
-                if tempboard[originalPos[0]][originalPos[1]-i]  not in ["white_queen","white_rook",""]:
-                    flag =False
-                    break
-                if tempboard[originalPos[0]][originalPos[1]-i] == "white_queen" or tempboard[originalPos[0]][originalPos[1]-i] == "white_rook":
-                    flag= True
-                    break
-                i+=1
-            i = 1
-            while originalPos[0] - i >8 and not flag:
-                if tempboard[originalPos[0]-i][originalPos[1]] == "white_king"  and i==1:
-                    flag= True
-                    break
-                if tempboard[originalPos[0]-i][originalPos[1]]  not in ["white_queen","white_rook",""]:
-                    flag =False
-                    break
-                if tempboard[originalPos[0]-i][originalPos[1]] == "white_queen" or tempboard[originalPos[0]-i][originalPos[1]] == "white_rook":
-                    flag= True
-                    break
-                i+=1
-            i = 1
-            # check knight:
-            if not flag:
-                moves = [(-1,-2), (-1,2), (1,-2), (1,2), (-2,-1), (-2,1), (2,-1), (2,1)]
-                for move in moves:
-                    new_row = originalPos[0] + move[0]
-                    new_col = originalPos[1] + move[1]
-                    if 0 <= new_row < 8 and 0 <= new_col < 8:
-                        if tempboard[new_row][new_col] == 'white_knight':
-                            flag =True
-            return flag
-        if player == "white":
-            
-            i = 1
-            #check diag
-            flag =False
-            while originalPos[0] - i > 0 and originalPos[1] - i > 0 and not flag:
-                
-                if (tempboard[originalPos[0]-i][originalPos[1]-i] == "black_pawn" or tempboard[originalPos[0]-i][originalPos[1]-i] == "black_king") and i==1:
-                    flag= True
-                    break
-                
-                if tempboard[originalPos[0]-i][originalPos[1]-i]  not in ["black_queen","black_bishop",""]:
-                    
-                    flag =False
-                    break
-                
-                if tempboard[originalPos[0]-i][originalPos[1]-i] == "black_queen" or tempboard[originalPos[0]-i][originalPos[1]-i] == "black_bishop":
-                    
-                    flag= True
-                    break
-                i+=1
-            i = 1
-            
-            while originalPos[0] - i > 0 and originalPos[1] + i < 8 and not flag:
-                
-                if (tempboard[originalPos[0]-i][originalPos[1]+i] == "black_pawn" or tempboard[originalPos[0]-i][originalPos[1]+i] == "black_king") and i==1:
-                    flag= True
-                    break
-                
-                if tempboard[originalPos[0]-i][originalPos[1]+i]  not in ["black_queen","black_bishop",""]:
-                    flag =False
-                    break
-
-                if tempboard[originalPos[0]-i][originalPos[1]+i] == "black_queen" or tempboard[originalPos[0]-i][originalPos[1]+i] == "black_bishop":
-                    flag= True
-                    break
-                i+=1
-            i = 1
-            
-            while originalPos[0] + i < 8 and originalPos[1] - i > 0 and not flag:
-                
-                if  tempboard[originalPos[0]+i][originalPos[1]-i] == "black_king" and i==1:
-                    flag= True
-                    break
-                if tempboard[originalPos[0]+i][originalPos[1]-i]  not in ["black_queen","black_bishop",""]:
-                    flag =False
-                    break
-                if tempboard[originalPos[0]+i][originalPos[1]-i] == "black_queen" or tempboard[originalPos[0]+i][originalPos[1]-i] == "black_bishop":
-                    flag= True
-                    break
-                i+=1
-            i = 1
-
-            while originalPos[0] + i < 8 and originalPos[1] + i <8 and not flag:
-                
-                if tempboard[originalPos[0]+i][originalPos[1]+i] == "black_king" and i==1:
-                    flag= True
-                    break
-                if tempboard[originalPos[0]+i][originalPos[1]+i]  not in ["black_queen","black_bishop",""]:
-                    flag =False
-                    break
-                if tempboard[originalPos[0]+i][originalPos[1]+i] == "black_queen" or tempboard[originalPos[0]+i][originalPos[1]+i] == "black_bishop":
-                    flag= True
-                    break
-                i+=1
-            i = 1
-            # check cross:
-            while originalPos[1] + i <8 and not flag:
-                
-                if tempboard[originalPos[0]][originalPos[1]+i] == "black_king"  and i==1:
-                    flag= True
-                    break
-                if tempboard[originalPos[0]][originalPos[1]+i]  not in ["black_queen","black_rook",""]:
-                    flag =False
-                    break
-                if tempboard[originalPos[0]][originalPos[1]+i] == "black_queen" or tempboard[originalPos[0]][originalPos[1]+i] == "black_rook":
-                    flag= True
-                    break
-                i+=1
-            i = 1
-            while originalPos[0] + i <8 and not flag:
-                
-                if tempboard[originalPos[0]+i][originalPos[1]] == "black_king"  and i==1:
-                    flag= True
-                    break
-                if tempboard[originalPos[0]+i][originalPos[1]]  not in ["black_queen","black_rook",""]:
-                    flag =False
-                    break
-                if tempboard[originalPos[0]+i][originalPos[1]] == "black_queen" or tempboard[originalPos[0]+i][originalPos[1]] == "black_rook":
-                    flag= True
-                    break
-                i+=1
-            i = 1
-            
-            while originalPos[1] - i >0 and not flag:
-                
-                if tempboard[originalPos[0]][originalPos[1]-i] == "black_king"  and i==1:
-                    flag= True
-                    break
-                if tempboard[originalPos[0]][originalPos[1]-i]  not in ["black_queen","black_rook",""]:
-                    flag =False
-                    break
-                if tempboard[originalPos[0]][originalPos[1]-i] == "black_queen" or tempboard[originalPos[0]][originalPos[1]-i] == "black_rook":
-                    flag= True
-                    break
-                i+=1
-            i = 1
-            while originalPos[0] - i >0 and not flag:
-                
-                if tempboard[originalPos[0]-i][originalPos[1]] == "black_king"  and i==1:
-                    flag= True
-                    break
-                if tempboard[originalPos[0]-i][originalPos[1]]  not in ["black_queen","black_rook",""]:
-                    flag =False
-                    break
-                if tempboard[originalPos[0]-i][originalPos[1]] == "black_queen" or tempboard[originalPos[0]-i][originalPos[1]] == "black_rook":
-                    flag= True
-                    break
-                i+=1
-            i = 1
-            # check knight:
-            if not flag:
-                moves = [(-1,-2), (-1,2), (1,-2), (1,2), (-2,-1), (-2,1), (2,-1), (2,1)]
-                for move in moves:
-                    new_row = originalPos[0] + move[0]
-                    new_col = originalPos[1] + move[1]
-                    if 0 <= new_row < 8 and 0 <= new_col < 8:
-                        if tempboard[new_row][new_col] == 'black_knight':
-                            flag =True
-            return flag
+        if board:
+            return Position(board).is_check(COLOR_NAMES.index(player))
+        return self.position.in_check(COLOR_NAMES.index(player))
        
     def isCheckMate(self,player:str=['white','black']):
-        if not self.isCheck(None, player):
+        color = COLOR_NAMES.index(player)
+        if not self.position.in_check(color):
+            return False
+        if self.position.legal_moves(color):
             return False
-        moves = self.get_all_possible_moves(player)
-        for ele in moves:
-            print(ele)
-        board = copy.deepcopy(self.current_board)
-
-        for move in moves:
-            board = copy.deepcopy(self.current_board)
-
-            unit = board[move.position[0]][move.position[1]]
-            print(unit)
-            board[move.position[0]][move.position[1]] = ""
-            board[move.new_pos[0]][move.new_pos[1]] = unit
-            if move.special_move == "promote":
-                board[move.new_pos[0]][move.new_pos[1]] = move.promoted
-
-            if not self.isCheck(board,player):
-                return False
         if player == "white":
             self.is_checkmated = "white"
         else:
@@ -1596,60 +449,17 @@ class ChessBoard(tk.Tk):
     def is_draw(self,player: str = ['white', 'black']):
         if self.is_draw_by_insufficient_material():
             return True
-        if player =="white":
-            res = self.get_all_possible_moves("white")
-            if len(res) == 0 and not self.isCheck(None, player):
-                self.is_stalemated = 'white'
-                return True
-            return False
-        if player == "black":
-            res = self.get_all_possible_moves("black")
-            if len(res) == 0 and not self.isCheck(None, player):
-                self.is_stalemated = 'black'
-                return True
-            return False
+        color = COLOR_NAMES.index(player)
+        if not self.position.legal_moves(color) and not self.position.in_check(color):
+            self.is_stalemated = player
+            return True
+        return False
     
     def count_material(self):
-        white = 0
-        black = 0
-        for row in self.current_board:
-            for unit in row:
-                if unit.find("white") == 0:
-                    white += 1
-                if unit.find("black") == 0:
-                    black += 1
-        return white + black
+        return popcount(self.position.occupied)
     
     def is_draw_by_insufficient_material(self):
-        # if only kings are left
-        material_count = self.count_material()
-        if material_count == 2:
-            return True
-       
-        if material_count == 3:
-            # King vs King and Bishop
-            for row in self.current_board:
-                for unit in row:
-                    if unit.find("bishop") == 0:
-                        return True
-            
-            # King vs King and Knight
-            for row in self.current_board:
-                for unit in row:
-                    if unit.find("knight") == 0:
-                        return True
-            
-        if material_count == 4:
-            # King and Bishop vs King and Bishop with bishops on the same color
-            bishops = []
-            for row in self.current_board:
-                for unit in row:
-                    if unit.find("bishop") == 0:
-                        bishops.append(unit)
-            if len(bishops) == 2:
-                if bishops[0][6:] == bishops[1][6:]:
-                    return True
-        return False  
+        return self.position.insufficient_material()
         
     def is_game_over(self):
         if self.is_draw("white") or self.is_draw("black") or self.is_draw_by_insufficient_material():
@@ -1674,4 +484,4 @@ class ChessBoard(tk.Tk):
             return "draw"
 
     def copy(self):
-        return ChessBoard(current_board=self.current_board, current_player=self.current_player, move_log=self.move_log, draw_board=False)
+        return ChessBoard(current_player=self.current_player, move_log=self.move_log, draw_board=False, position=self.position.copy())
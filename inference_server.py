@@ -0,0 +1,171 @@
+import queue
+import socket
+import socketserver
+import struct
+import threading
+import time
+from concurrent.futures import Future
+import numpy as np
+import torch
+from data_preprocessing import board_to_tensor
+
+INPUT_SHAPE = (14, 8, 8) # board_to_tensor output
+POLICY_SIZE = 4096
+
+class InferenceServer:
+    # Runs the network in one thread on batches gathered from every search that submits to it.
+    # A batch is sent as soon as it holds max_batch_size positions or its first request has
+    # waited max_latency seconds, whichever comes first.
+    def __init__(self, model, max_batch_size=256, max_latency=0.002):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency
+        self.requests = queue.Queue() # (tensors, future), None stops the server
+        self.stopped = False
+        self.stop_lock = threading.Lock() # nothing is queued behind the stop marker
+        self.thread = None
+        self.socket_server = None
+        self.batches = 0
+        self.positions = 0
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        if self.socket_server is not None:
+            self.socket_server.shutdown()
+            self.socket_server.server_close()
+            self.socket_server = None
+        with self.stop_lock:
+            self.stopped = True
+            self.requests.put(None)
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        self.fail_pending() # never started, or requests the run loop did not get to
+
+    def submit(self, tensors):
+        # tensors: (n, 14, 8, 8); the future resolves to (policy rows, values) as numpy arrays
+        future = Future()
+        with self.stop_lock:
+            if self.stopped:
+                raise RuntimeError("inference server is stopped")
+            self.requests.put((tensors, future))
+        return future
+
+    def evaluate(self, boards):
+        # same result as mcts.evaluate_batch, shared with whoever else is asking
+        tensors = torch.stack([board_to_tensor(board) for board in boards])
+        return self.submit(tensors).result()
+
+    def run(self):
+        stopping = False
+        while not stopping:
+            request = self.requests.get()
+            if request is None:
+                break
+            pending = [request]
+            size = len(request[0])
+            deadline = time.perf_counter() + self.max_latency
+            while size < self.max_batch_size:
+                timeout = deadline - time.perf_counter()
+                if timeout <= 0:
+                    break
+                try:
+                    request = self.requests.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if request is None:
+                    stopping = True # answer what is already queued, then stop
+                    break
+                pending.append(request)
+                size += len(request[0])
+            self.run_batch(pending)
+        self.fail_pending()
+
+    def fail_pending(self):
+        # resolve whatever is left in the queue so no caller waits forever
+        while True:
+            try:
+                request = self.requests.get_nowait()
+            except queue.Empty:
+                return
+            if request is not None:
+                request[1].set_exception(RuntimeError("inference server is stopped"))
+
+    def run_batch(self, pending):
+        try:
+            batch = torch.cat([tensors for tensors, _ in pending])
+            with torch.no_grad():
+                policy_probs, value_estimates = self.model(batch)
+            policy_probs = policy_probs.numpy()
+            value_estimates = value_estimates.view(-1).numpy()
+        except Exception as error:
+            for _, future in pending:
+                future.set_exception(error)
+            return
+        self.batches += 1
+        self.positions += len(batch)
+        start = 0
+        for tensors, future in pending:
+            end = start + len(tensors)
+            future.set_result((policy_probs[start:end], value_estimates[start:end]))
+            start = end
+
+    def serve(self, address=("127.0.0.1", 0)):
+        # Optional socket frontend so searches in other processes can share this server.
+        # Returns the bound address; InferenceClient speaks the protocol.
+        server = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                while True:
+                    header = recv_exactly(self.request, 4)
+                    if header is None:
+                        return
+                    count, = struct.unpack("!I", header)
+                    data = recv_exactly(self.request, count * np.prod(INPUT_SHAPE) * 4)
+                    if data is None:
+                        return
+                    tensors = torch.from_numpy(np.frombuffer(data, dtype=np.float32).reshape((count,) + INPUT_SHAPE).copy())
+                    policy_probs, value_estimates = server.submit(tensors).result()
+                    self.request.sendall(policy_probs.astype(np.float32).tobytes() + value_estimates.astype(np.float32).tobytes())
+
+        self.socket_server = socketserver.ThreadingTCPServer(address, Handler)
+        self.socket_server.daemon_threads = True
+        threading.Thread(target=self.socket_server.serve_forever, daemon=True).start()
+        return self.socket_server.server_address
+
+def recv_exactly(connection, size):
+    chunks = []
+    while size > 0:
+        chunk = connection.recv(min(size, 1 << 20))
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+class InferenceClient:
+    # evaluate() for a search running in another process than the InferenceServer
+    def __init__(self, address):
+        self.connection = socket.create_connection(address)
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.lock = threading.Lock()
+
+    def evaluate(self, boards):
+        tensors = torch.stack([board_to_tensor(board) for board in boards]).numpy().astype(np.float32)
+        count = len(boards)
+        with self.lock:
+            self.connection.sendall(struct.pack("!I", count) + tensors.tobytes())
+            data = recv_exactly(self.connection, count * (POLICY_SIZE + 1) * 4)
+        if data is None:
+            raise ConnectionError("inference server closed the connection")
+        results = np.frombuffer(data, dtype=np.float32)
+        return results[:count * POLICY_SIZE].reshape(count, POLICY_SIZE), results[count * POLICY_SIZE:]
+
+    def close(self):
+        self.connection.close()
@@ -1,87 +1,745 @@
 import math
+import sys
+import multiprocessing
+import time
+import threading
+import weakref
+from collections import OrderedDict
 import chess
 import chess.engine
 import torch
 from neural_net import NeuralNet
-from data_preprocessing import board_to_tensor
+from data_preprocessing import board_to_tensor, encode_move
 from agent import Agent
 import numpy as np
 
+def evaluate_batch(model, boards):
+    # one forward pass for all boards; returns (policy rows, values) as numpy arrays
+    batch = torch.stack([board_to_tensor(board) for board in boards])
+    with torch.no_grad():
+        policy_probs, value_estimates = model(batch)
+    return policy_probs.numpy(), value_estimates.view(-1).numpy()
+
+def piece_key(board):
+    # pieces, side to move and castling rights, from the public chess.Board attributes
+    return (board.occupied_co[chess.WHITE], board.occupied_co[chess.BLACK], board.pawns, board.knights,
+            board.bishops, board.rooks, board.queens, board.kings, board.turn, board.clean_castling_rights())
+
+def position_key(board):
+    # Transpositions count en passant only when a capture is possible, like repetitions do.
+    # The ply means a repetition can never make a node its own ancestor.
+    ep_square = board.ep_square if board.has_legal_en_passant() else None
+    return (piece_key(board), ep_square, board.ply())
+
+def evaluation_key(board):
+    # everything board_to_tensor encodes; unlike position_key it keeps the raw en passant
+    # square, which the network sees even when no capture is possible
+    return (piece_key(board), board.ep_square)
+
+def legal_priors(board, policy_probs):
+    # The policy head is indexed like encode_move (from * 64 + to), so the legal moves'
+    # priors are one gather. Promotions to different pieces share an index and split its
+    # probability between them.
+    legal_moves = list(board.legal_moves)
+    indices = np.fromiter(map(encode_move, legal_moves), dtype=np.intp, count=len(legal_moves))
+    legal_policy_probs = np.asarray(policy_probs, dtype=np.float32)[indices]
+    legal_policy_probs /= np.bincount(indices, minlength=4096)[indices]
+
+    # Normalize probabilities over the legal moves only
+    total = legal_policy_probs.sum()
+    if total > 0:
+        legal_policy_probs /= total
+    elif len(legal_moves) > 0:
+        legal_policy_probs[:] = 1.0 / len(legal_moves)
+    return legal_policy_probs
+
+# Root-parallel workers: each process owns a NeuralNet and an MCTS built from the parent's settings
+worker_mcts = None
+
+def init_root_worker(state_dict, settings):
+    global worker_mcts
+    torch.set_num_threads(1) # the processes already use every core
+    np.random.seed() # fresh root noise per process, or all searches would be identical
+    model = NeuralNet()
+    model.load_state_dict(state_dict)
+    model.eval()
+    worker_mcts = MCTS(model, **settings)
+
+def root_worker_search(board):
+    root = Node(board)
+    worker_mcts.search(root)
+    return root.moves, root.child_visits, root.child_values
+
+MEMORY_CHECK_INTERVAL = 64 # simulations between two reads of the process memory
+PRUNE_TARGET = 0.75 # share of max_nodes left after pruning, so pruning does not run every batch
+MAX_FREE_NODES = 100000 # released nodes kept for reuse when the pool has no max_nodes
+
+def node_bytes(node):
+    # Approximate memory held by one node: its attributes, move list, statistics arrays and
+    # its board with the move history it keeps (only the public move_stack is counted)
+    size = sys.getsizeof(node) + sys.getsizeof(node.__dict__) + sys.getsizeof(node.children)
+    size += sys.getsizeof(node.moves) + sum(sys.getsizeof(move) for move in node.moves)
+    for array in (node.priors, node.child_visits, node.child_values, node.child_virtual):
+        if array is not None:
+            size += sys.getsizeof(array)
+    board = node.board
+    if board is not None:
+        size += sys.getsizeof(board)
+        size += sys.getsizeof(board.move_stack) + sum(sys.getsizeof(move) for move in board.move_stack)
+    return size
+
+class EvaluationCache:
+    # evaluation key -> (legal move priors, value), least recently used entries evicted first.
+    # Priors follow board.legal_moves order, which is fixed for a given position.
+    def __init__(self, capacity=100000):
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, entry):
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+class TranspositionTable:
+    # position key -> Node; weak values so released subtrees drop out on their own
+    def __init__(self):
+        self.nodes = weakref.WeakValueDictionary()
+        self.lock = threading.Lock()
+        self.hits = 0
+
+    def get_or_create(self, board, parent, move, pool=None):
+        # board is the position after move; nodes do not keep it, so the key is stored instead.
+        # Links the node to one more parent: counted under the table lock, since parents
+        # holding different node locks can reach the same transposition at once.
+        key = position_key(board)
+        with self.lock:
+            node = self.nodes.get(key)
+            if node is not None:
+                self.hits += 1
+            else:
+                node = pool.allocate(parent=parent, move=move) if pool is not None else Node(parent=parent, move=move)
+                node.key = key
+                self.nodes[key] = node
+            node.parent_count += 1
+            return node
+
+    def discard(self, node):
+        with self.lock:
+            if node.key is not None and self.nodes.get(node.key) is node:
+                del self.nodes[node.key]
+
+    def add(self, root):
+        root.key = position_key(root.board)
+        with self.lock:
+            self.nodes.setdefault(root.key, root)
+
+    def __len__(self):
+        return len(self.nodes)
+
+class NodePool:
+    # Allocates Nodes, reusing the ones released from pruned or abandoned subtrees, and
+    # counts how many are in use so the search can hold the tree to max_nodes
+    def __init__(self, max_nodes=None):
+        self.max_nodes = max_nodes
+        self.free = []
+        self.in_use = 0
+        self.lock = threading.Lock()
+
+    def allocate(self, board=None, parent=None, move=None):
+        with self.lock:
+            self.in_use += 1
+            node = self.free.pop() if self.free else None
+        if node is None:
+            return Node(board, parent=parent, move=move)
+        node.reset(board, parent, move)
+        return node
+
+    def adopt(self, root):
+        # count a root built outside the pool, as the caller's first Node(board) is
+        if root.parent_count == 0:
+            with self.lock:
+                self.in_use += 1
+            root.parent_count = 1
+
+    def over_budget(self):
+        return self.max_nodes is not None and self.in_use > self.max_nodes
+
+    def drop(self, node, transpositions=None):
+        # Drop one reference to node; it and the descendants nobody else links to are
+        # released. A transposed node survives while another parent still has it.
+        stack = [(node, None)]
+        while stack:
+            node, parent = stack.pop()
+            node.parent_count -= 1
+            if node.parent_count > 0:
+                if parent is not None and node.parent is parent:
+                    node.parent_ref = None # that parent is about to be reused
+                continue
+            stack.extend((child, node) for child in node.children.values())
+            if transpositions is not None:
+                transpositions.discard(node)
+            node.reset() # let go of the arrays and children while parked
+            with self.lock:
+                self.in_use -= 1
+                if len(self.free) < (self.max_nodes or MAX_FREE_NODES):
+                    self.free.append(node)
+
 class Node:
-    def __init__(self, board, parent=None):
+    # A root holds its board; every other node only holds the move leading to it and the
+    # search replays moves from the root onto a scratch board
+    def __init__(self, board=None, parent=None, move=None):
+        # guards this node's statistics and children in parallel search
+        self.lock = threading.Lock()
+        self.reset(board, parent, move)
+
+    def reset(self, board=None, parent=None, move=None):
         self.board = board
-        self.parent = parent
-        self.children = {}
+        self.move = move
+        self.key = None # transposition key, while the node is in the table
+        # Weak, so the tree has no reference cycles: a subtree nobody points to any more is
+        # freed at once instead of waiting for the garbage collector
+        self.parent_ref = weakref.ref(parent) if parent is not None else None
+        self.moves = [] # legal moves, set on expansion
+        self.priors = None # prior per entry of self.moves
+        self.noise_free_priors = None # set while self.priors carries root exploration noise
+        # Statistics of the edge to each move, index-aligned with self.moves, so selection
+        # reads three contiguous arrays instead of one object per child
+        self.child_visits = None
+        self.child_values = None # sum of values backed up through the edge
+        self.child_virtual = None # evaluations still pending below the edge
+        self.children = {} # move -> Node, only for children that have been selected
         self.visit_count = 0
         self.total_value = 0.0
         self.prior_policy = None
         self.value_estimate = 0.0
+        self.expanding = False
+        self.parent_count = 0 # parents linking here through children; more than one for transpositions
+
+    @property
+    def parent(self):
+        return self.parent_ref() if self.parent_ref is not None else None
 
     def is_expanded(self):
-        return len(self.children) > 0
-
-    def expand(self, model):
-        legal_moves = list(self.board.legal_moves)
-        board_tensor = board_to_tensor(self.board)
-        with torch.no_grad():
-            policy_probs, value_estimate = model(board_tensor.unsqueeze(0))
-        
-        policy_probs = policy_probs.squeeze().detach().numpy()
-
-        # Map policy probs to legal moves
-        legal_policy_probs = np.zeros(len(legal_moves))
-        for idx, move in enumerate(legal_moves):
-            uci_move = move.uci()
-            legal_policy_probs[idx] = policy_probs[idx]  # Assuming the model output aligns with legal move indices
-
-        # Normalize probabilities
-        legal_policy_probs /= legal_policy_probs.sum()
-        
-        self.value_estimate = value_estimate.item()
-
-        for move, prob in zip(legal_moves, legal_policy_probs):
-            new_board = self.board.copy()
-            new_board.push(move)
-            self.children[move] = Node(new_board, parent=self)
-            self.children[move].prior_policy = prob
+        return len(self.moves) > 0
+
+    def expand(self, model, board=None):
+        board = self.board if board is None else board
+        policy_probs, value_estimates = evaluate_batch(model, [board])
+        self.expand_with(legal_priors(board, policy_probs[0]), value_estimates[0], board)
+
+    def expand_with(self, legal_policy_probs, value_estimate, board):
+        # board is this node's position. Only the moves and their priors are stored; child
+        # nodes are built by child() the first time the search selects them
+        self.moves = list(board.legal_moves)
+        self.priors = legal_policy_probs
+        self.child_visits = np.zeros(len(self.moves))
+        self.child_values = np.zeros(len(self.moves))
+        self.child_virtual = np.zeros(len(self.moves))
+        self.value_estimate = float(value_estimate)
+
+    def child(self, index, board=None, transpositions=None, pool=None):
+        # board, the position after the move, is only needed for the transposition lookup
+        move = self.moves[index]
+        child = self.children.get(move)
+        if child is None:
+            if transpositions is not None:
+                # a transposed child is shared, together with its evaluation and subtree
+                child = transpositions.get_or_create(board, self, move, pool)
+            else:
+                # a fresh node only this parent can reach, guarded by the parent's lock
+                child = pool.allocate(parent=self, move=move) if pool is not None else Node(parent=self, move=move)
+                child.parent_count += 1
+            child.prior_policy = self.priors[index]
+            self.children[move] = child
+        return child
 
 class MCTS:
-    def __init__(self, model, simulations=800):
+    def __init__(self, model, simulations=800, batch_size=8, virtual_loss=1.0, num_threads=1, use_transpositions=True,
+                 cache_size=100000, evaluation_cache=None, selection="uct", c_puct=1.5, fpu_reduction=0.25,
+                 dirichlet_alpha=0.3, dirichlet_epsilon=0.25, time_limit=None, node_limit=None, memory_limit=None,
+                 early_stop=True, num_processes=1, inference=None, max_nodes=None):
         self.model = model
+        self.transpositions = TranspositionTable() if use_transpositions else None
+        # evaluations outlive the tree: pass the same cache to later searches or games to reuse them
+        if evaluation_cache is None and cache_size:
+            evaluation_cache = EvaluationCache(cache_size)
+        self.evaluation_cache = evaluation_cache
         self.simulations = simulations
+        self.batch_size = batch_size # leaves evaluated per forward pass
+        self.virtual_loss = virtual_loss
+        self.num_threads = num_threads # > 1 runs parallel_search with workers sharing the tree
+        # parallel_search: signalled whenever a leaf expansion finishes, and what workers raised
+        self.expansion_done = threading.Condition()
+        self.worker_errors = []
+        # "uct" explores every move once before exploiting; "puct" follows the network priors
+        self.selection = selection
+        self.c_puct = c_puct
+        self.fpu_reduction = fpu_reduction # unvisited moves start this far below the parent's value
+        self.dirichlet_alpha = dirichlet_alpha
+        self.dirichlet_epsilon = dirichlet_epsilon # share of noise in the root priors, 0 disables it
+        # Search stops at whichever comes first: simulations, time_limit seconds, node_limit
+        # visits of the root (reused subtree included), memory_limit bytes of process memory,
+        # or, with early_stop, once the remaining budget can no longer change the best move
+        self.time_limit = time_limit
+        self.node_limit = node_limit
+        self.memory_limit = memory_limit
+        self.early_stop = early_stop
+        self.search_start = 0.0
+        self.next_memory_check = 0
+        self.stop_reason = None
+        # > 1 runs process_search: independent searches in a process pool, merged at the root
+        if num_processes > 1 and not (selection == "puct" and dirichlet_epsilon > 0):
+            # only root noise makes the workers' searches differ; without it every process
+            # would run the same deterministic search
+            raise ValueError("num_processes > 1 needs selection=\"puct\" with dirichlet_epsilon > 0")
+        self.num_processes = num_processes
+        self.pool = None
+        # anything with evaluate(boards) -> (policy rows, values), e.g. an InferenceServer
+        # batching for many searches at once; None runs self.model directly
+        self.inference = inference
+        # Every node comes from node_pool; past max_nodes the least visited subtrees are
+        # released between batches. Their edge statistics stay with the parent, so the
+        # search only loses the detail below them.
+        self.node_pool = NodePool(max_nodes)
+        self.ponder_thread = None
+        self.ponder_stop = threading.Event()
+        self.ponder_simulations = 0
+        self.ponder_error = None # what the ponder thread raised, re-raised by stop_pondering()
 
     def search(self, root):
-        for _ in range(self.simulations):
+        if self.num_processes > 1:
+            return self.process_search(root)
+        self.node_pool.adopt(root)
+        if self.transpositions is not None:
+            self.transpositions.add(root)
+        if self.selection == "puct" and self.dirichlet_epsilon > 0:
+            self.add_dirichlet_noise(root)
+        self.search_start = time.perf_counter()
+        self.next_memory_check = 0
+        if self.num_threads > 1:
+            # workers keep paths into the tree, so the budget is only enforced before they start
+            if self.node_pool.over_budget():
+                self.prune(root)
+            return self.parallel_search(root)
+        done = 0
+        scratch = root.board.copy(stack=False)
+        while not self.should_stop(root, done):
+            if self.node_pool.over_budget():
+                self.prune(root)
+            batch_size = min(self.batch_size, max(1, int(self.remaining_simulations(root, done))))
+            done += self.run_batch(root, batch_size, scratch)
+
+    def run_batch(self, root, batch_size, scratch):
+        # Collect up to batch_size distinct leaves; virtual loss on their paths steers
+        # the following descents towards other parts of the tree. scratch starts and ends
+        # at the root position; each descent pushes its moves and pops them again.
+        leaves = []
+        for _ in range(batch_size):
             node = root
             search_path = [node]
+            edges = [] # (parent, move index) for every step of the descent
             while node.is_expanded():
-                move, node = self.select(node)
+                index = self.select_index(node)
+                edges.append((node, index))
+                scratch.push(node.moves[index])
+                node = node.child(index, scratch, self.transpositions, self.node_pool)
                 search_path.append(node)
-            if not node.is_expanded():
-                node.expand(self.model)
+            collided = any(node is leaf for leaf, _, _, _ in leaves)
+            # the leaf's position is kept without history, only until it is evaluated
+            leaf_board = None if collided else scratch.copy(stack=False)
+            for _ in edges:
+                scratch.pop()
+            if collided:
+                break # collision with a pending leaf: evaluate what we have
+            for parent, index in edges:
+                parent.child_virtual[index] += 1
+            leaves.append((node, leaf_board, search_path, edges))
+
+        try:
+            evaluations = self.evaluate([leaf_board for _, leaf_board, _, _ in leaves])
+        except BaseException:
+            # leave no virtual loss behind to bias later searches of this tree
+            for _, _, _, edges in leaves:
+                self.undo_virtual_loss(edges)
+            raise
+        for (node, leaf_board, search_path, edges), (priors, value_estimate) in zip(leaves, evaluations):
+            for parent, index in edges:
+                parent.child_virtual[index] -= 1
+            node.expand_with(priors, value_estimate, leaf_board)
             value = self.simulate(node)
-            self.backpropagate(search_path, value)
+            self.backpropagate(search_path, edges, value)
+        return len(leaves)
+
+    def ponder(self, root):
+        # Keep searching root in a background thread, e.g. while the opponent thinks, until
+        # stop_pondering(); advance() then keeps the subtree of the move actually played.
+        # The tree must not be touched by anything else in between.
+        self.stop_pondering()
+        self.node_pool.adopt(root)
+        if self.transpositions is not None:
+            self.transpositions.add(root)
+        self.ponder_stop.clear()
+        self.ponder_simulations = 0
+        self.ponder_thread = threading.Thread(target=self.ponder_loop, args=(root,), daemon=True)
+        self.ponder_thread.start()
+
+    def ponder_loop(self, root):
+        try:
+            self.ponder_search(root)
+        except BaseException as error:
+            self.ponder_error = error
+
+    def ponder_search(self, root):
+        # no simulation or time budget, but node and memory limits still hold
+        self.next_memory_check = 0
+        scratch = root.board.copy(stack=False)
+        while not self.ponder_stop.is_set():
+            if self.node_limit is not None and root.visit_count >= self.node_limit:
+                return
+            if (self.memory_limit is not None and self.ponder_simulations >= self.next_memory_check
+                    and self.memory_exceeded()):
+                return
+            if self.node_pool.over_budget():
+                self.prune(root)
+            self.ponder_simulations += self.run_batch(root, self.batch_size, scratch)
+
+    def stop_pondering(self):
+        # returns the number of simulations run while pondering
+        if self.ponder_thread is not None:
+            self.ponder_stop.set()
+            self.ponder_thread.join()
+            self.ponder_thread = None
+        if self.ponder_error is not None:
+            error, self.ponder_error = self.ponder_error, None
+            raise error # fail like a search would
+        return self.ponder_simulations
+
+    def parallel_search(self, root):
+        remaining = [self.simulations]
+        budget_lock = threading.Lock()
+        self.worker_errors = []
+
+        def worker():
+            try:
+                scratch = root.board.copy(stack=False) # one per thread
+                while True:
+                    with budget_lock:
+                        if self.worker_errors or self.should_stop(root, self.simulations - remaining[0]):
+                            return
+                        remaining[0] -= 1
+                    self.parallel_simulation(root, scratch)
+            except BaseException as error:
+                # stop the other workers, including any waiting on this worker's leaf
+                with self.expansion_done:
+                    self.worker_errors.append(error)
+                    self.expansion_done.notify_all()
+
+        workers = [threading.Thread(target=worker, daemon=True) for _ in range(self.num_threads)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        if self.worker_errors:
+            raise self.worker_errors[0] # fail like the serial search does
+
+    def worker_settings(self):
+        # everything a root-parallel worker needs to search like this MCTS, minus the processes
+        return dict(simulations=self.simulations, batch_size=self.batch_size, virtual_loss=self.virtual_loss,
+                    use_transpositions=self.transpositions is not None,
+                    cache_size=self.evaluation_cache.capacity if self.evaluation_cache is not None else 0,
+                    selection=self.selection, c_puct=self.c_puct, fpu_reduction=self.fpu_reduction,
+                    dirichlet_alpha=self.dirichlet_alpha, dirichlet_epsilon=self.dirichlet_epsilon,
+                    time_limit=self.time_limit, node_limit=self.node_limit, memory_limit=self.memory_limit,
+                    early_stop=self.early_stop)
+
+    def process_search(self, root):
+        # Every process searches the root with the full budget and nothing shared, so there is
+        # no GIL or lock contention; only the root's edge statistics come back and are summed.
+        # The searches differ through root noise, which __init__ makes sure is on.
+        if self.pool is None:
+            context = multiprocessing.get_context("spawn") # torch does not survive fork reliably
+            self.pool = context.Pool(self.num_processes, initializer=init_root_worker,
+                                     initargs=(self.model.state_dict(), self.worker_settings()))
+        results = self.pool.map(root_worker_search, [root.board] * self.num_processes, chunksize=1)
+        if not root.is_expanded():
+            priors, value_estimate = self.evaluate([root.board])[0]
+            root.expand_with(priors, value_estimate, root.board)
+        index_of = {move: index for index, move in enumerate(root.moves)}
+        for moves, visits, values in results:
+            for move, move_visits, move_value in zip(moves, visits, values):
+                root.child_visits[index_of[move]] += move_visits
+                root.child_values[index_of[move]] += move_value
+            root.visit_count += int(visits.sum())
+            root.total_value += float(values.sum())
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+    def parallel_simulation(self, root, scratch):
+        # Locks are only ever taken parent before child, and never held across the
+        # forward pass, so other workers keep descending while torch runs without the GIL
+        node = root
+        search_path = [node]
+        edges = []
+        while True:
+            with node.lock:
+                if not node.is_expanded():
+                    if node.expanding:
+                        collided = True
+                    else:
+                        node.expanding = True
+                        collided = False
+                    break
+                index = self.select_index(node)
+                node.child_virtual[index] += 1
+                scratch.push(node.moves[index])
+                child = node.child(index, scratch, self.transpositions, self.node_pool)
+            edges.append((node, index))
+            node = child
+            search_path.append(node)
+
+        leaf_board = None if collided else scratch.copy(stack=False)
+        for _ in edges:
+            scratch.pop()
+        if collided:
+            # Another worker is evaluating this leaf. Keep the virtual loss on the path and
+            # wait for that evaluation instead of descending again into the same collision,
+            # then back its value up as this simulation's result.
+            with self.expansion_done:
+                self.expansion_done.wait_for(lambda: not node.expanding or self.worker_errors)
+            if self.worker_errors:
+                self.undo_virtual_loss(edges)
+                return
+        else:
+            try:
+                priors, value_estimate = self.evaluate([leaf_board])[0]
+                with node.lock:
+                    node.expand_with(priors, value_estimate, leaf_board)
+            except BaseException:
+                self.undo_virtual_loss(edges)
+                raise
+            finally:
+                with node.lock:
+                    node.expanding = False
+                with self.expansion_done:
+                    self.expansion_done.notify_all()
+        value = self.simulate(node)
+        with node.lock:
+            node.visit_count += 1
+            node.total_value += value
+        for parent, index in reversed(edges):
+            with parent.lock:
+                parent.child_virtual[index] -= 1
+                parent.child_visits[index] += 1
+                parent.child_values[index] += value
+                parent.visit_count += 1
+                parent.total_value += value
+
+    def undo_virtual_loss(self, edges):
+        for parent, index in edges:
+            with parent.lock:
+                parent.child_virtual[index] -= 1
+
+    def should_stop(self, root, done):
+        if done >= self.simulations:
+            self.stop_reason = "simulations"
+        elif self.time_limit is not None and time.perf_counter() - self.search_start >= self.time_limit:
+            self.stop_reason = "time"
+        elif self.node_limit is not None and root.visit_count >= self.node_limit:
+            self.stop_reason = "nodes"
+        elif self.memory_limit is not None and done >= self.next_memory_check and self.memory_exceeded():
+            self.stop_reason = "memory"
+        elif self.early_stop and self.best_move_decided(root, done):
+            self.stop_reason = "decided"
+        else:
+            return False
+        return True
+
+    def memory_exceeded(self):
+        import psutil
+        self.next_memory_check += MEMORY_CHECK_INTERVAL
+        return psutil.Process().memory_info().rss >= self.memory_limit
+
+    def remaining_simulations(self, root, done):
+        # what the tightest limit still allows, the time limit extrapolated from the rate so far
+        remaining = self.simulations - done
+        if self.node_limit is not None:
+            remaining = min(remaining, self.node_limit - root.visit_count)
+        if self.time_limit is not None and done > 0:
+            elapsed = time.perf_counter() - self.search_start
+            remaining = min(remaining, done * (self.time_limit - elapsed) / elapsed)
+        return remaining
+
+    def best_move_decided(self, root, done):
+        # True when the most visited move stays ahead even if every remaining simulation
+        # went to the runner-up; a forced move is decided as soon as the root is expanded
+        if not root.is_expanded():
+            return False
+        if len(root.moves) == 1:
+            return True
+        runner_up, best = np.partition(root.child_visits, -2)[-2:]
+        return best - runner_up > self.remaining_simulations(root, done)
+
+    def best_move(self, root):
+        return root.moves[int(np.argmax(root.child_visits))]
+
+    def evaluate(self, boards):
+        # (legal priors, value) per board; only cache misses go through the network
+        cache = self.evaluation_cache
+        results = [None] * len(boards)
+        keys = [None] * len(boards)
+        if cache is not None:
+            for i, board in enumerate(boards):
+                keys[i] = evaluation_key(board)
+                results[i] = cache.get(keys[i])
+        missing = [i for i, entry in enumerate(results) if entry is None]
+        if missing:
+            missing_boards = [boards[i] for i in missing]
+            if self.inference is not None:
+                policy_probs, value_estimates = self.inference.evaluate(missing_boards)
+            else:
+                policy_probs, value_estimates = evaluate_batch(self.model, missing_boards)
+            for i, policy, value_estimate in zip(missing, policy_probs, value_estimates):
+                results[i] = (legal_priors(boards[i], policy), float(value_estimate))
+                if cache is not None:
+                    cache.put(keys[i], results[i])
+        return results
+
+    def advance(self, root, move):
+        # New root after move is played, keeping the statistics already gathered below it.
+        # The old root forgets its children, so sibling subtrees are released right away.
+        self.node_pool.adopt(root)
+        board = root.board.copy()
+        board.push(move)
+        if move in root.moves:
+            new_root = root.child(root.moves.index(move), board, self.transpositions, self.node_pool)
+            del root.children[move] # the old root's link now keeps the new root alive
+        else:
+            new_root = self.node_pool.allocate()
+            new_root.parent_count = 1
+        new_root.board = board # the only board the tree keeps
+        new_root.parent_ref = None
+        self.node_pool.drop(root, self.transpositions)
+        return new_root
 
-    def select(self, node):
-        total_visits = sum(child.visit_count for child in node.children.values())
-        total_visits += 1e-8  # Avoid division by zero
-        log_total = math.log(total_visits)
-        best_move, best_child = max(node.children.items(), key=lambda item: self.uct(item[1], log_total))
-        return best_move, best_child
+    def prune(self, root):
+        # Release the least visited subtrees until the pool is down to PRUNE_TARGET of
+        # max_nodes. Only called between batches, when no search path is pending.
+        links = []
+        seen = {id(root)}
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            for move, child in node.children.items():
+                links.append((child.visit_count, id(child), node, move, child))
+                if id(child) not in seen:
+                    seen.add(id(child))
+                    stack.append(child)
+        links.sort(key=lambda link: link[:2])
+        target = int(self.node_pool.max_nodes * PRUNE_TARGET)
+        for _, _, parent, move, child in links:
+            if self.node_pool.in_use <= target:
+                break
+            if parent.children.get(move) is not child:
+                continue # parent released earlier in this pass
+            del parent.children[move]
+            self.node_pool.drop(child, self.transpositions)
 
-    def uct(self, child, log_total):
-        if child.visit_count == 0:
-            return float('inf')  # Return infinity for unvisited nodes
-        exploration_factor = math.sqrt(log_total / child.visit_count)
-        return child.total_value / child.visit_count + exploration_factor
+    def memory_report(self, root):
+        # nodes reachable from root and their approximate size in bytes
+        nodes, total = 0, 0
+        seen = {id(root)}
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            nodes += 1
+            total += node_bytes(node)
+            for child in node.children.values():
+                if id(child) not in seen:
+                    seen.add(id(child))
+                    stack.append(child)
+        return {"nodes": nodes, "bytes": total, "bytes_per_node": total / nodes,
+                "pool_in_use": self.node_pool.in_use, "pool_free": len(self.node_pool.free)}
+
+    def add_dirichlet_noise(self, root):
+        # The root is expanded up front so the noise is in place before the first selection.
+        # Noise is mixed into a copy of the clean priors: the cached priors are shared, and a
+        # root reused by the next search must not accumulate noise.
+        if not root.is_expanded():
+            priors, value_estimate = self.evaluate([root.board])[0]
+            root.expand_with(priors, value_estimate, root.board)
+            self.backpropagate([root], [], self.simulate(root))
+        if not root.is_expanded():
+            return # no legal moves
+        if root.noise_free_priors is None:
+            root.noise_free_priors = root.priors
+        noise = np.random.dirichlet([self.dirichlet_alpha] * len(root.moves))
+        root.priors = (1 - self.dirichlet_epsilon) * root.noise_free_priors + self.dirichlet_epsilon * noise
+
+    def select_index(self, node):
+        scores = self.puct(node) if self.selection == "puct" else self.uct(node)
+        return int(np.argmax(scores))
+
+    def uct(self, node):
+        # UCT score of every move of node at once; pending evaluations count as
+        # visits that returned a loss, unvisited moves score infinity
+        visits = node.child_visits + node.child_virtual
+        log_total = math.log(max(visits.sum(), 1.0))
+        safe_visits = np.maximum(visits, 1.0) # visit counts are whole numbers, only zeros change
+        scores = (node.child_values - self.virtual_loss * node.child_virtual) / safe_visits
+        scores += np.sqrt(log_total / safe_visits)
+        scores[visits == 0] = np.inf
+        return scores
+
+    def puct(self, node):
+        # AlphaZero's Q + c_puct * P * sqrt(N) / (1 + n) for every move of node at once
+        visits = node.child_visits + node.child_virtual
+        visited = visits > 0
+        q_values = (node.child_values - self.virtual_loss * node.child_virtual) / np.maximum(visits, 1.0)
+        # first play urgency: unvisited moves get the parent's value, reduced by how much
+        # prior mass has already been explored
+        parent_value = node.total_value / node.visit_count if node.visit_count else node.value_estimate
+        q_values[~visited] = parent_value - self.fpu_reduction * math.sqrt(node.priors[visited].sum())
+        exploration = self.c_puct * node.priors * (math.sqrt(max(visits.sum(), 1.0)) / (1.0 + visits))
+        return q_values + exploration
 
     def simulate(self, node):
         return node.value_estimate
 
-    def backpropagate(self, path, value):
+    def backpropagate(self, path, edges, value):
         for node in reversed(path):
             node.visit_count += 1
             node.total_value += value
+        for parent, index in edges:
+            parent.child_visits[index] += 1
+            parent.child_values[index] += value
 
 # Example usage
 if __name__ == "__main__":
@@ -94,33 +752,31 @@ if __name__ == "__main__":
     # Demo game Agent vs MCTS
     agent = Agent(chess.WHITE)
     mcts = MCTS(model)
-    root = Node(board)
+    root = Node(board.copy())
     
     move_count = 0
     # Play a game between Agent and MCTS
     while not board.is_game_over():
         if board.turn == agent.get_color():
+            # Search the current position while Stockfish thinks
+            mcts.ponder(root)
             move = agent.get_move(board)
+            pondered = mcts.stop_pondering()
             move_count += 1
-            print(f"Agent moves: {move}")
+            print(f"Agent moves: {move} ({pondered} simulations pondered)")
+            # Keep the part of the tree below the opponent's move
+            root = mcts.advance(root, move)
             board.push(move)
-            # Update root to reflect the new board state
-            if move in root.children:
-                root = root.children[move]
-            else:
-                root = Node(board)
         else:
             mcts.search(root)
-            best_move, _ = mcts.select(root)
+            best_move = mcts.best_move(root)
             move_count += 1
             print(f"MCTS moves: {best_move}")
+            root = mcts.advance(root, best_move)
             board.push(best_move)
-            # Update root to reflect the new board state
-            if best_move in root.children:
-                root = root.children[best_move]
-            else:
-                root = Node(board)
-                
+
+    mcts.close()
+
     # Statistic of the game
     print("Game over")
     # Open a file for writing
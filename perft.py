@@ -0,0 +1,86 @@
+import argparse
+import time
+from position import Position, STARTING_FEN, MAX_MOVES, move_to_uci
+
+# Reference positions from the chessprogramming wiki: (name, fen, node counts for depth 1, 2, ...)
+PERFT_SUITE = [
+    ("startpos", STARTING_FEN,
+     [20, 400, 8902, 197281, 4865609]),
+    ("kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+     [48, 2039, 97862, 4085603]),
+    ("position3", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+     [14, 191, 2812, 43238, 674624]),
+    ("position4", "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+     [6, 264, 9467, 422333]),
+    ("position5", "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+     [44, 1486, 62379, 2103487]),
+    ("position6", "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+     [46, 2079, 89890, 3894594]),
+]
+
+def perft(position, depth, buffers=None):
+    # one preallocated move buffer per remaining depth, reused across the whole tree
+    if depth == 0:
+        return 1
+    if buffers is None:
+        buffers = [[0] * MAX_MOVES for _ in range(depth + 1)]
+    buffer = buffers[depth]
+    count = position.generate_moves(position.turn, buffer)
+    if depth == 1:
+        return count
+    nodes = 0
+    for i in range(count):
+        position.push(buffer[i])
+        nodes += perft(position, depth - 1, buffers)
+        position.pop()
+    return nodes
+
+def divide(position, depth):
+    counts = {}
+    for move in position.generate_legal_moves(position.turn):
+        position.push(move)
+        counts[move_to_uci(move)] = perft(position, depth - 1)
+        position.pop()
+    return counts
+
+def timed_perft(position, depth):
+    start = time.perf_counter()
+    nodes = perft(position, depth)
+    elapsed = time.perf_counter() - start
+    return nodes, elapsed
+
+def run_suite(max_depth):
+    passed = True
+    total_nodes, total_time = 0, 0.0
+    for name, fen, expected in PERFT_SUITE:
+        position = Position()
+        position.set_fen(fen)
+        for depth in range(1, min(max_depth, len(expected)) + 1):
+            nodes, elapsed = timed_perft(position, depth)
+            total_nodes += nodes
+            total_time += elapsed
+            status = "ok" if nodes == expected[depth - 1] else f"FAIL (expected {expected[depth - 1]})"
+            print(f"{name:<10} depth {depth}: {nodes:>10} nodes {elapsed:8.3f}s {nodes / max(elapsed, 1e-9):>10.0f} nps  {status}")
+            passed = passed and nodes == expected[depth - 1]
+    print(f"total: {total_nodes} nodes in {total_time:.3f}s, {total_nodes / max(total_time, 1e-9):.0f} nps")
+    return passed
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Perft node counts for the ChessBoard move generator")
+    parser.add_argument("--fen", help="position to count from; runs the reference suite when omitted")
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--divide", action="store_true", help="print the node count below each root move")
+    args = parser.parse_args()
+
+    if args.fen is None:
+        raise SystemExit(0 if run_suite(args.depth) else 1)
+
+    position = Position()
+    position.set_fen(args.fen)
+    if args.divide:
+        counts = divide(position, args.depth)
+        for move in sorted(counts):
+            print(f"{move}: {counts[move]}")
+        print(f"moves: {len(counts)}")
+    nodes, elapsed = timed_perft(position, args.depth)
+    print(f"nodes: {nodes}, time: {elapsed:.3f}s, nps: {nodes / max(elapsed, 1e-9):.0f}")
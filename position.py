@@ -0,0 +1,614 @@
+import random
+
+# Bitboard layout: bit 0 is a1 (row 7, col 0), bit 63 is h8 (row 0, col 7)
+WHITE, BLACK = 0, 1
+PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = range(6)
+COLOR_NAMES = ['white', 'black']
+PIECE_NAMES = ['pawn', 'knight', 'bishop', 'rook', 'queen', 'king']
+# 'black_knight' -> (BLACK, KNIGHT)
+PIECE_CODES = {COLOR_NAMES[c] + '_' + PIECE_NAMES[p]: (c, p) for c in (WHITE, BLACK) for p in range(6)}
+PIECE_STRINGS = {code: name for name, code in PIECE_CODES.items()}
+FEN_PIECES = 'pnbrqk'
+FEN_CASTLING = [('K', 1), ('Q', 2), ('k', 4), ('q', 8)]
+STARTING_FEN = 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1'
+
+# Castling rights bits
+WHITE_KINGSIDE, WHITE_QUEENSIDE, BLACK_KINGSIDE, BLACK_QUEENSIDE = 1, 2, 4, 8
+# king destination -> (rook from, rook to)
+CASTLING_ROOK_SQUARES = {6: (7, 5), 2: (0, 3), 62: (63, 61), 58: (56, 59)}
+# (right, king from, king to, squares that must be empty, squares the king crosses)
+CASTLING_MOVES = [
+    [(WHITE_KINGSIDE, 4, 6, 0x60, (5, 6)), (WHITE_QUEENSIDE, 4, 2, 0x0E, (3, 2))],
+    [(BLACK_KINGSIDE, 60, 62, 0x60 << 56, (61, 62)), (BLACK_QUEENSIDE, 60, 58, 0x0E << 56, (59, 58))],
+]
+# right -> home square of its rook (python-chess stores castling rights as these squares)
+CASTLING_ROOKS = [(WHITE_KINGSIDE, 7), (WHITE_QUEENSIDE, 0), (BLACK_KINGSIDE, 63), (BLACK_QUEENSIDE, 56)]
+# rights that survive a move touching the square
+CASTLING_MASK = [15] * 64
+CASTLING_MASK[0] &= ~WHITE_QUEENSIDE
+CASTLING_MASK[7] &= ~WHITE_KINGSIDE
+CASTLING_MASK[4] &= ~(WHITE_KINGSIDE | WHITE_QUEENSIDE)
+CASTLING_MASK[56] &= ~BLACK_QUEENSIDE
+CASTLING_MASK[63] &= ~BLACK_KINGSIDE
+CASTLING_MASK[60] &= ~(BLACK_KINGSIDE | BLACK_QUEENSIDE)
+
+# positions whose legal moves / check status are remembered by Position.state()
+STATE_CACHE_SIZE = 4096
+
+BB_ALL = (1 << 64) - 1
+BB_LIGHT_SQUARES = 0x55AA55AA55AA55AA
+BB_DARK_SQUARES = 0xAA55AA55AA55AA55
+
+try:
+    popcount = int.bit_count
+except AttributeError:
+    def popcount(bb):
+        return bin(bb).count('1')
+
+# Zobrist keys, seeded so hashes are stable across runs
+_zobrist_random = random.Random(20240601)
+ZOBRIST_PIECES = [[[_zobrist_random.getrandbits(64) for _ in range(64)] for _ in range(6)] for _ in range(2)]
+ZOBRIST_CASTLING = [_zobrist_random.getrandbits(64) for _ in range(16)]
+ZOBRIST_EP_FILE = [_zobrist_random.getrandbits(64) for _ in range(8)]
+ZOBRIST_BLACK_TO_MOVE = _zobrist_random.getrandbits(64)
+
+def square(row, col):
+    return (7 - row) * 8 + col
+
+def square_to_pos(sq):
+    return (7 - (sq >> 3), sq & 7)
+
+def square_name(sq):
+    return 'abcdefgh'[sq & 7] + str((sq >> 3) + 1)
+
+def parse_square(name):
+    if len(name) != 2 or name[0] not in 'abcdefgh' or name[1] not in '12345678':
+        raise ValueError(f"invalid square: {name!r}")
+    return (int(name[1]) - 1) * 8 + 'abcdefgh'.index(name[0])
+
+# Packed move: from | to << 6 | promotion << 12 | flags | moving piece << 17,
+# where promotion is 0 or KNIGHT..QUEEN and the moving piece is color * 6 + piece_type
+MOVE_CASTLE = 1 << 15
+MOVE_EN_PASSANT = 1 << 16
+MOVE_PIECE_SHIFT = 17
+MAX_MOVES = 256
+
+def encode_move(from_sq, to_sq, promotion=0, flags=0, piece=(WHITE, PAWN)):
+    return from_sq | to_sq << 6 | promotion << 12 | flags | (piece[0] * 6 + piece[1]) << MOVE_PIECE_SHIFT
+
+def move_to_uci(move):
+    promotion = move >> 12 & 7
+    return square_name(move & 63) + square_name(move >> 6 & 63) + (FEN_PIECES[promotion] if promotion else '')
+
+def scan_squares(bb):
+    while bb:
+        lsb = bb & -bb
+        yield lsb.bit_length() - 1
+        bb ^= lsb
+
+# Attack tables, built once at import time
+def _step_attacks(sq, deltas):
+    bb = 0
+    rank, file = sq >> 3, sq & 7
+    for dr, df in deltas:
+        if 0 <= rank + dr < 8 and 0 <= file + df < 8:
+            bb |= 1 << ((rank + dr) * 8 + file + df)
+    return bb
+
+def _ray(sq, dr, df):
+    bb = 0
+    rank, file = (sq >> 3) + dr, (sq & 7) + df
+    while 0 <= rank < 8 and 0 <= file < 8:
+        bb |= 1 << (rank * 8 + file)
+        rank, file = rank + dr, file + df
+    return bb
+
+KNIGHT_ATTACKS = [_step_attacks(sq, [(-1,-2), (-1,2), (1,-2), (1,2), (-2,-1), (-2,1), (2,-1), (2,1)]) for sq in range(64)]
+KING_ATTACKS = [_step_attacks(sq, [(1,0), (-1,0), (0,1), (0,-1), (1,1), (-1,-1), (1,-1), (-1,1)]) for sq in range(64)]
+PAWN_ATTACKS = [
+    [_step_attacks(sq, [(1,-1), (1,1)]) for sq in range(64)], # white pawns capture towards rank 8
+    [_step_attacks(sq, [(-1,-1), (-1,1)]) for sq in range(64)],
+]
+# (rays, positive): for rays pointing to higher squares the nearest blocker is the lowest set bit
+ROOK_RAYS = [([_ray(sq, dr, df) for sq in range(64)], dr > 0 or (dr == 0 and df > 0)) for dr, df in [(1,0), (0,1), (-1,0), (0,-1)]]
+BISHOP_RAYS = [([_ray(sq, dr, df) for sq in range(64)], dr > 0) for dr, df in [(1,1), (1,-1), (-1,1), (-1,-1)]]
+
+def _slider_attacks(sq, occupied, directions):
+    attacks = 0
+    for rays, positive in directions:
+        ray = rays[sq]
+        blockers = ray & occupied
+        if blockers:
+            if positive:
+                ray ^= rays[(blockers & -blockers).bit_length() - 1]
+            else:
+                ray ^= rays[blockers.bit_length() - 1]
+        attacks |= ray
+    return attacks
+
+def rook_attacks(sq, occupied):
+    return _slider_attacks(sq, occupied, ROOK_RAYS)
+
+def bishop_attacks(sq, occupied):
+    return _slider_attacks(sq, occupied, BISHOP_RAYS)
+
+def queen_attacks(sq, occupied):
+    return _slider_attacks(sq, occupied, ROOK_RAYS) | _slider_attacks(sq, occupied, BISHOP_RAYS)
+
+ROOK_EMPTY_ATTACKS = [rook_attacks(sq, 0) for sq in range(64)]
+BISHOP_EMPTY_ATTACKS = [bishop_attacks(sq, 0) for sq in range(64)]
+def _line_tables():
+    # BETWEEN[a][b]: squares strictly between two aligned squares, LINE[a][b]: the whole line through them
+    between = [[0] * 64 for _ in range(64)]
+    line = [[0] * 64 for _ in range(64)]
+    opposite = ROOK_RAYS[2:] + ROOK_RAYS[:2] + BISHOP_RAYS[::-1]
+    for a in range(64):
+        for (rays, _), (back, _) in zip(ROOK_RAYS + BISHOP_RAYS, opposite):
+            for b in scan_squares(rays[a]):
+                between[a][b] = rays[a] & ~rays[b] & ~(1 << b)
+                line[a][b] = rays[a] | back[a] | (1 << a)
+    return between, line
+
+BETWEEN, LINE = _line_tables()
+
+class Position():
+    # GUI-free rules engine; ChessBoard wraps one of these
+    __slots__ = ('pieces', 'occupied_co', 'occupied', 'mailbox', 'turn', 'castling', 'ep_square',
+                 'halfmove_clock', 'fullmove_number', 'zobrist_key', 'undo_stack', 'state_cache',
+                 'move_buffer')
+
+    def __init__(self, board=None, turn=WHITE):
+        self.pieces = [[0] * 6, [0] * 6] # pieces[color][piece_type]
+        self.occupied_co = [0, 0]
+        self.occupied = 0
+        self.mailbox = [None] * 64 # (color, piece_type) per square
+        self.turn = turn
+        self.castling = 0
+        self.ep_square = None
+        self.halfmove_clock = 0
+        self.fullmove_number = 1
+        self.zobrist_key = 0
+        # (from, to, piece_type, captured, capture square, promotion or 0, castling, ep_square, halfmove_clock, zobrist_key)
+        self.undo_stack = []
+        # zobrist_key -> [white moves, black moves, white in check, black in check, insufficient material]
+        self.state_cache = {}
+        # scratch space for generate_legal_moves; never shared, so copy() gives each its own
+        self.move_buffer = [0] * MAX_MOVES
+        if board is not None:
+            self.load(board)
+
+    def copy(self):
+        position = Position.__new__(Position)
+        position.pieces = [self.pieces[WHITE][:], self.pieces[BLACK][:]]
+        position.occupied_co = self.occupied_co[:]
+        position.occupied = self.occupied
+        position.mailbox = self.mailbox[:]
+        position.turn = self.turn
+        position.castling = self.castling
+        position.ep_square = self.ep_square
+        position.halfmove_clock = self.halfmove_clock
+        position.fullmove_number = self.fullmove_number
+        position.zobrist_key = self.zobrist_key
+        position.undo_stack = self.undo_stack[:]
+        # entries only depend on the position behind the key, so copies can share them
+        position.state_cache = self.state_cache
+        position.move_buffer = [0] * MAX_MOVES
+        return position
+
+    def clear(self):
+        self.pieces = [[0] * 6, [0] * 6]
+        self.occupied_co = [0, 0]
+        self.occupied = 0
+        self.mailbox = [None] * 64
+        self.zobrist_key = 0
+        self.undo_stack = []
+
+    def load(self, board):
+        self.clear()
+        for i in range(8):
+            for j in range(8):
+                if board[i][j] != "":
+                    color, piece_type = PIECE_CODES[board[i][j]]
+                    self.set_piece(square(i, j), color, piece_type)
+        # a nested list carries no history, so grant castling when king and rook are at home
+        self.castling = self.home_castling_rights()
+        self.ep_square = None
+        self.zobrist_key = self.zobrist_hash()
+
+    def set_fen(self, fen):
+        parts = fen.split()
+        if len(parts) < 4:
+            raise ValueError(f"invalid fen: {fen!r}")
+        rows = parts[0].split('/')
+        if len(rows) != 8:
+            raise ValueError(f"invalid fen placement: {parts[0]!r}")
+        self.clear()
+        for row, placement in enumerate(rows):
+            col = 0
+            for ch in placement:
+                if ch.isdigit():
+                    col += int(ch)
+                elif ch.lower() in FEN_PIECES and col < 8:
+                    self.set_piece(square(row, col), WHITE if ch.isupper() else BLACK, FEN_PIECES.index(ch.lower()))
+                    col += 1
+                else:
+                    raise ValueError(f"invalid fen placement: {parts[0]!r}")
+            if col != 8:
+                raise ValueError(f"invalid fen placement: {parts[0]!r}")
+        if parts[1] not in ('w', 'b'):
+            raise ValueError(f"invalid fen turn: {parts[1]!r}")
+        self.turn = WHITE if parts[1] == 'w' else BLACK
+        self.castling = 0
+        if parts[2] != '-':
+            for ch in parts[2]:
+                if ch not in 'KQkq':
+                    raise ValueError(f"invalid fen castling: {parts[2]!r}")
+                self.castling |= dict(FEN_CASTLING)[ch]
+        # a right whose king or rook has left home can never be used
+        self.castling &= self.home_castling_rights()
+        self.ep_square = None if parts[3] == '-' else parse_square(parts[3])
+        self.halfmove_clock = int(parts[4]) if len(parts) > 4 else 0
+        self.fullmove_number = int(parts[5]) if len(parts) > 5 else 1
+        self.zobrist_key = self.zobrist_hash()
+
+    def home_castling_rights(self):
+        # the castling rights whose king and rook both stand on their home squares
+        rights = 0
+        for color in (WHITE, BLACK):
+            for right, king_from, king_to, _, _ in CASTLING_MOVES[color]:
+                rook_from = CASTLING_ROOK_SQUARES[king_to][0]
+                if self.mailbox[king_from] == (color, KING) and self.mailbox[rook_from] == (color, ROOK):
+                    rights |= right
+        return rights
+
+    def fen(self):
+        rows = []
+        for row in range(8):
+            text, empty = '', 0
+            for col in range(8):
+                piece = self.mailbox[square(row, col)]
+                if piece is None:
+                    empty += 1
+                    continue
+                if empty:
+                    text, empty = text + str(empty), 0
+                text += FEN_PIECES[piece[1]].upper() if piece[0] == WHITE else FEN_PIECES[piece[1]]
+            rows.append(text + str(empty) if empty else text)
+        castling = ''.join(ch for ch, right in FEN_CASTLING if self.castling & right) or '-'
+        ep = square_name(self.ep_square) if self.ep_square is not None else '-'
+        return f"{'/'.join(rows)} {'wb'[self.turn]} {castling} {ep} {self.halfmove_clock} {self.fullmove_number}"
+
+    def load_chess_board(self, board):
+        # copy the bitboards of a python-chess Board directly, no per-square strings
+        import chess
+        self.clear()
+        for color, chess_color in ((WHITE, chess.WHITE), (BLACK, chess.BLACK)):
+            occupied = board.occupied_co[chess_color]
+            for piece_type, bb in enumerate((board.pawns, board.knights, board.bishops, board.rooks, board.queens, board.kings)):
+                for sq in scan_squares(bb & occupied):
+                    self.set_piece(sq, color, piece_type)
+        self.turn = WHITE if board.turn == chess.WHITE else BLACK
+        self.castling = 0
+        for right, rook_sq in CASTLING_ROOKS:
+            if board.clean_castling_rights() >> rook_sq & 1: # raw rights may lack king or rook
+                self.castling |= right
+        self.ep_square = board.ep_square
+        self.halfmove_clock = board.halfmove_clock
+        self.fullmove_number = board.fullmove_number
+        self.zobrist_key = self.zobrist_hash()
+
+    def to_chess_board(self):
+        import chess
+        board = chess.Board(None)
+        pieces = [self.pieces[WHITE][p] | self.pieces[BLACK][p] for p in range(6)]
+        board.pawns, board.knights, board.bishops, board.rooks, board.queens, board.kings = pieces
+        board.occupied_co[chess.WHITE] = self.occupied_co[WHITE]
+        board.occupied_co[chess.BLACK] = self.occupied_co[BLACK]
+        board.occupied = self.occupied
+        board.turn = chess.WHITE if self.turn == WHITE else chess.BLACK
+        board.castling_rights = 0
+        for right, rook_sq in CASTLING_ROOKS:
+            if self.castling & right:
+                board.castling_rights |= 1 << rook_sq
+        board.ep_square = self.ep_square
+        board.halfmove_clock = self.halfmove_clock
+        board.fullmove_number = self.fullmove_number
+        return board
+
+    def zobrist_hash(self):
+        # full recomputation; push/pop keep zobrist_key up to date incrementally
+        key = 0
+        for sq, piece in enumerate(self.mailbox):
+            if piece is not None:
+                key ^= ZOBRIST_PIECES[piece[0]][piece[1]][sq]
+        return key ^ self.state_key()
+
+    def state_key(self):
+        # castling, en-passant and side-to-move part of the key; the ep file only
+        # counts when a capture is actually possible so transpositions hash equal
+        key = ZOBRIST_CASTLING[self.castling]
+        if self.ep_captures(self.turn):
+            key ^= ZOBRIST_EP_FILE[self.ep_square & 7]
+        if self.turn == BLACK:
+            key ^= ZOBRIST_BLACK_TO_MOVE
+        return key
+
+    def set_piece(self, sq, color, piece_type):
+        bb = 1 << sq
+        self.pieces[color][piece_type] |= bb
+        self.occupied_co[color] |= bb
+        self.occupied |= bb
+        self.mailbox[sq] = (color, piece_type)
+        self.zobrist_key ^= ZOBRIST_PIECES[color][piece_type][sq]
+
+    def remove_piece(self, sq):
+        piece = self.mailbox[sq]
+        if piece is None:
+            return None
+        bb = ~(1 << sq)
+        self.pieces[piece[0]][piece[1]] &= bb
+        self.occupied_co[piece[0]] &= bb
+        self.occupied &= bb
+        self.mailbox[sq] = None
+        self.zobrist_key ^= ZOBRIST_PIECES[piece[0]][piece[1]][sq]
+        return piece
+
+    def piece_at(self, sq):
+        return self.mailbox[sq]
+
+    def king_square(self, color):
+        kings = self.pieces[color][KING]
+        return (kings & -kings).bit_length() - 1 if kings else None
+
+    def attacks(self, sq, color, piece_type, occupied=None):
+        if occupied is None:
+            occupied = self.occupied
+        if piece_type == PAWN:
+            return PAWN_ATTACKS[color][sq]
+        if piece_type == KNIGHT:
+            return KNIGHT_ATTACKS[sq]
+        if piece_type == BISHOP:
+            return bishop_attacks(sq, occupied)
+        if piece_type == ROOK:
+            return rook_attacks(sq, occupied)
+        if piece_type == QUEEN:
+            return queen_attacks(sq, occupied)
+        return KING_ATTACKS[sq]
+
+    def attackers(self, color, sq, occupied=None):
+        if occupied is None:
+            occupied = self.occupied
+        pieces = self.pieces[color]
+        queens = pieces[QUEEN]
+        return ((KNIGHT_ATTACKS[sq] & pieces[KNIGHT])
+                | (KING_ATTACKS[sq] & pieces[KING])
+                | (PAWN_ATTACKS[color ^ 1][sq] & pieces[PAWN])
+                | (rook_attacks(sq, occupied) & (pieces[ROOK] | queens))
+                | (bishop_attacks(sq, occupied) & (pieces[BISHOP] | queens)))
+
+    def is_check(self, color):
+        king = self.king_square(color)
+        return king is not None and self.attackers(color ^ 1, king) != 0
+
+    def targets(self, sq, color, piece_type):
+        # squares a piece can move to ignoring checks: pushes and captures for pawns,
+        # empty or enemy-occupied attacked squares for everything else
+        if piece_type != PAWN:
+            return self.attacks(sq, color, piece_type) & ~self.occupied_co[color]
+        targets = PAWN_ATTACKS[color][sq] & self.occupied_co[color ^ 1]
+        step = 8 if color == WHITE else -8
+        push = sq + step
+        if 0 <= push < 64 and not self.occupied >> push & 1:
+            targets |= 1 << push
+            if (sq >> 3) == (1 if color == WHITE else 6) and not self.occupied >> (push + step) & 1:
+                targets |= 1 << (push + step)
+        return targets
+
+    def ep_captures(self, color):
+        # pawns of color that can capture en passant
+        if self.ep_square is None or color != self.turn:
+            return 0
+        return PAWN_ATTACKS[color ^ 1][self.ep_square] & self.pieces[color][PAWN]
+
+    def castling_targets(self, color):
+        targets = 0
+        if not self.castling & (3 << (2 * color)) or self.is_check(color):
+            return targets
+        for right, king_from, king_to, empty, crossed in CASTLING_MOVES[color]:
+            rook_from = CASTLING_ROOK_SQUARES[king_to][0]
+            # the rook check keeps push from ever conjuring a rook, whatever set the rights
+            if self.castling & right and self.pieces[color][ROOK] >> rook_from & 1 and not self.occupied & empty:
+                if not any(self.attackers(color ^ 1, sq) for sq in crossed):
+                    targets |= 1 << king_to
+        return targets
+
+    def pinned(self, color, king):
+        # own pieces that are the only blocker between the king and an enemy slider
+        them = self.pieces[color ^ 1]
+        snipers = ((ROOK_EMPTY_ATTACKS[king] & (them[ROOK] | them[QUEEN]))
+                   | (BISHOP_EMPTY_ATTACKS[king] & (them[BISHOP] | them[QUEEN])))
+        pinned = 0
+        for sniper in scan_squares(snipers):
+            blockers = BETWEEN[king][sniper] & self.occupied
+            if blockers and not blockers & (blockers - 1):
+                pinned |= blockers & self.occupied_co[color]
+        return pinned
+
+    def generate_moves(self, color, buffer):
+        # writes packed legal moves into buffer[0:n] and returns n; checkers and pins
+        # are computed once and pseudo-legal targets are masked instead of replaying every move
+        n = 0
+        king = self.king_square(color)
+        them = color ^ 1
+        own = self.occupied_co[color]
+        piece_base = (color * 6) << MOVE_PIECE_SHIFT
+        king_move = king | piece_base | KING << MOVE_PIECE_SHIFT
+        occupied_without_king = self.occupied & ~(1 << king)
+        for to_sq in scan_squares(KING_ATTACKS[king] & ~own):
+            if not self.attackers(them, to_sq, occupied_without_king):
+                buffer[n] = king_move | to_sq << 6
+                n += 1
+
+        checkers = self.attackers(them, king)
+        if checkers & (checkers - 1):
+            return n # double check: only the king may move
+        if checkers:
+            evasions = BETWEEN[king][checkers.bit_length() - 1] | checkers
+        else:
+            evasions = BB_ALL
+            for to_sq in scan_squares(self.castling_targets(color)):
+                buffer[n] = king_move | to_sq << 6 | MOVE_CASTLE
+                n += 1
+
+        pinned = self.pinned(color, king)
+        last_rank = 7 if color == WHITE else 0
+        mailbox = self.mailbox
+        for sq in scan_squares(own & ~self.pieces[color][KING]):
+            piece_type = mailbox[sq][1]
+            targets = self.targets(sq, color, piece_type) & evasions
+            if pinned >> sq & 1:
+                targets &= LINE[king][sq]
+            base = sq | piece_base | piece_type << MOVE_PIECE_SHIFT
+            if piece_type == PAWN:
+                for to_sq in scan_squares(targets):
+                    if to_sq >> 3 == last_rank:
+                        for promotion in (QUEEN, ROOK, BISHOP, KNIGHT):
+                            buffer[n] = base | to_sq << 6 | promotion << 12
+                            n += 1
+                    else:
+                        buffer[n] = base | to_sq << 6
+                        n += 1
+            else:
+                for to_sq in scan_squares(targets):
+                    buffer[n] = base | to_sq << 6
+                    n += 1
+
+        # en passant can expose the king along the rank, so it is checked by replaying it
+        for sq in scan_squares(self.ep_captures(color)):
+            capture_sq = self.ep_square - 8 if color == WHITE else self.ep_square + 8
+            if self.leaves_king_safe(sq, self.ep_square, color, capture_sq):
+                buffer[n] = sq | self.ep_square << 6 | piece_base | MOVE_EN_PASSANT
+                n += 1
+        return n
+
+    def generate_legal_moves(self, color):
+        # moves are generated into the reusable buffer; only the n results are copied out
+        buffer = self.move_buffer
+        return buffer[:self.generate_moves(color, buffer)]
+
+    def state(self):
+        # entries are keyed by the position hash, so push/pop implicitly switch to
+        # a fresh entry and never read a stale one
+        state = self.state_cache.get(self.zobrist_key)
+        if state is None:
+            if len(self.state_cache) >= STATE_CACHE_SIZE:
+                self.state_cache.clear()
+            state = self.state_cache[self.zobrist_key] = [None, None, None, None, None]
+        return state
+
+    def legal_moves(self, color):
+        # cached generate_legal_moves; the returned list is shared and must not be modified
+        state = self.state()
+        if state[color] is None:
+            state[color] = self.generate_legal_moves(color)
+        return state[color]
+
+    def in_check(self, color):
+        state = self.state()
+        if state[2 + color] is None:
+            state[2 + color] = self.is_check(color)
+        return state[2 + color]
+
+    def insufficient_material(self):
+        state = self.state()
+        if state[4] is None:
+            state[4] = self.is_insufficient_material()
+        return state[4]
+
+    def is_insufficient_material(self):
+        # if only kings are left
+        material_count = popcount(self.occupied)
+        if material_count == 2:
+            return True
+        
+        bishops = self.pieces[WHITE][BISHOP] | self.pieces[BLACK][BISHOP]
+        knights = self.pieces[WHITE][KNIGHT] | self.pieces[BLACK][KNIGHT]
+        if material_count == 3:
+            # King vs King and Bishop / King vs King and Knight
+            if bishops or knights:
+                return True
+            
+        if material_count == 4:
+            # King and Bishop vs King and Bishop with bishops on the same color
+            if popcount(bishops) == 2:
+                if not bishops & BB_LIGHT_SQUARES or not bishops & BB_DARK_SQUARES:
+                    return True
+        return False
+
+    def leaves_king_safe(self, from_sq, to_sq, color, capture_sq=None):
+        # play the move on the occupancy only; the captured piece is masked out of the attackers
+        if capture_sq is None:
+            capture_sq = to_sq
+        capture_bb = 1 << capture_sq
+        occupied = (self.occupied & ~(1 << from_sq) & ~capture_bb) | (1 << to_sq)
+        king = to_sq if self.mailbox[from_sq][1] == KING else self.king_square(color)
+        return not self.attackers(color ^ 1, king, occupied) & ~capture_bb
+
+    def push(self, move):
+        from_sq, to_sq, promotion = move & 63, move >> 6 & 63, move >> 12 & 7
+        color, piece_type = self.mailbox[from_sq]
+        captured = self.mailbox[to_sq]
+        capture_sq = to_sq
+        if piece_type == PAWN and to_sq == self.ep_square:
+            capture_sq = to_sq - 8 if color == WHITE else to_sq + 8
+            captured = self.mailbox[capture_sq]
+        self.undo_stack.append((from_sq, to_sq, piece_type, captured, capture_sq, promotion,
+                                self.castling, self.ep_square, self.halfmove_clock, self.zobrist_key))
+        self.zobrist_key ^= self.state_key()
+
+        if captured is not None:
+            self.remove_piece(capture_sq)
+        self.remove_piece(from_sq)
+        self.set_piece(to_sq, color, promotion or piece_type)
+        if piece_type == KING and abs(to_sq - from_sq) == 2:
+            rook_from, rook_to = CASTLING_ROOK_SQUARES[to_sq]
+            self.remove_piece(rook_from)
+            self.set_piece(rook_to, color, ROOK)
+
+        self.castling &= CASTLING_MASK[from_sq] & CASTLING_MASK[to_sq]
+        self.ep_square = (from_sq + to_sq) >> 1 if piece_type == PAWN and abs(to_sq - from_sq) == 16 else None
+        self.halfmove_clock = 0 if piece_type == PAWN or captured is not None else self.halfmove_clock + 1
+        if color == BLACK:
+            self.fullmove_number += 1
+        self.turn = color ^ 1
+        self.zobrist_key ^= self.state_key()
+
+    def pop(self):
+        record = self.undo_stack.pop()
+        from_sq, to_sq, piece_type, captured, capture_sq, promotion, castling, ep_square, halfmove_clock, zobrist_key = record
+        color = self.mailbox[to_sq][0]
+        self.remove_piece(to_sq)
+        self.set_piece(from_sq, color, piece_type)
+        if piece_type == KING and abs(to_sq - from_sq) == 2:
+            rook_from, rook_to = CASTLING_ROOK_SQUARES[to_sq]
+            self.remove_piece(rook_to)
+            self.set_piece(rook_from, color, ROOK)
+        if captured is not None:
+            self.set_piece(capture_sq, captured[0], captured[1])
+
+        self.castling = castling
+        self.ep_square = ep_square
+        self.halfmove_clock = halfmove_clock
+        if color == BLACK:
+            self.fullmove_number -= 1
+        self.turn = color
+        self.zobrist_key = zobrist_key
+        return record
+
+    def to_list(self):
+        board = [[''] * 8 for _ in range(8)]
+        for sq, piece in enumerate(self.mailbox):
+            if piece is not None:
+                row, col = square_to_pos(sq)
+                board[row][col] = PIECE_STRINGS[piece]
+        return board